@@ -0,0 +1,62 @@
+"""Cross-process TTL cache with stale-while-revalidate, stored in MongoDB.
+
+Entries live in the cache_entries collection so every gunicorn worker sees
+the same value. Once an entry expires, the first worker to take its lease
+recomputes it on a background thread while every request, including that
+one, keeps getting the stale value. Only a missing entry is computed inline.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from models_mongo import CacheEntryDoc
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+
+def _collection():
+    return CacheEntryDoc._get_collection()
+
+
+def _store(key, value, ttl):
+    _collection().update_one(
+        {"_id": key},
+        {"$set": {"value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl),
+                  "lease_until": None}},
+        upsert=True)
+    return value
+
+
+def _refresh(key, compute, ttl):
+    try:
+        _store(key, compute(), ttl)
+    except Exception as e:
+        # Keep serving the stale value; the lease expires and another worker retries
+        print(f"⚠ Cache refresh failed for {key}: {e}")
+
+
+def _take_lease(key, lease):
+    """Atomically claim the right to refresh key; True for exactly one caller"""
+    now = datetime.utcnow()
+    result = _collection().update_one(
+        {"_id": key, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+        {"$set": {"lease_until": now + timedelta(seconds=lease)}})
+    return result.modified_count == 1
+
+
+def get_or_refresh(key, compute, ttl, lease=30):
+    """Return the cached value for key, refreshing it in the background once stale.
+
+    compute() must return a BSON-serialisable dict. lease bounds how long a
+    refresh may take before another worker is allowed to retry it.
+    """
+    entry = _collection().find_one({"_id": key})
+    if entry is None or entry.get("value") is None:
+        return _store(key, compute(), ttl)
+    if entry["expires_at"] <= datetime.utcnow() and _take_lease(key, lease):
+        _executor.submit(_refresh, key, compute, ttl)
+    return entry["value"]
+
+
+def invalidate(key):
+    """Mark key stale so the next read triggers a background refresh"""
+    _collection().update_one({"_id": key}, {"$set": {"expires_at": datetime.utcnow()}})
@@ -0,0 +1,308 @@
+"""Streaming CSV / XLSX exports for the reports dashboard.
+
+Each report names a document, the date field its range filters on and the
+columns to write. iter_rows() reads the collection through a raw cursor in
+batches of EXPORT_BATCH_SIZE and resolves referenced names with one $in
+query per batch; the writers turn each batch into bytes as it arrives, so
+an export holds one batch in memory however many rows it has.
+
+Large exports run as an ExportJobDoc on a background thread that writes the
+file into EXPORT_DIR, which must be shared by every worker serving
+downloads.
+"""
+import csv
+import io
+import os
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from models_mongo import (EmployeeDoc, ExportJobDoc, InspectionDoc, InventoryItemDoc, MachineDoc, ProductDoc,
+                          ProductionEntryDoc, PurchaseOrderDoc, ToolDoc, WorkOrderDoc)
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports"))
+EXPORT_RETENTION = timedelta(days=int(os.getenv("EXPORT_RETENTION_DAYS", "7")))
+
+# report -> document, the date field ranges apply to (None: current state),
+# columns as (header, field) and referenced fields as field -> (document, display field)
+REPORTS = {
+    "production": {
+        "title": "Production",
+        "document": ProductionEntryDoc,
+        "date_field": "date",
+        "columns": [("Date", "date"), ("Shift", "shift"), ("Work Order", "work_order"), ("Machine", "machine"),
+                    ("Operator", "operator"), ("Quantity Produced", "quantity_produced"), ("Remarks", "remarks")],
+        "references": {"work_order": (WorkOrderDoc, "work_order_number"), "machine": (MachineDoc, "name"),
+                       "operator": (EmployeeDoc, "name")},
+    },
+    "quality": {
+        "title": "Quality",
+        "document": InspectionDoc,
+        "date_field": "inspection_date",
+        "columns": [("Inspection No", "inspection_number"), ("Type", "inspection_type"),
+                    ("Date", "inspection_date"), ("Product", "product"), ("Work Order", "work_order"),
+                    ("Inspector", "inspector"), ("Inspected", "quantity_inspected"),
+                    ("Accepted", "quantity_accepted"), ("Rejected", "quantity_rejected"), ("Status", "status"),
+                    ("Remarks", "remarks")],
+        "references": {"product": (ProductDoc, "name"), "work_order": (WorkOrderDoc, "work_order_number"),
+                       "inspector": (EmployeeDoc, "name")},
+    },
+    "inventory": {
+        "title": "Inventory",
+        "document": ToolDoc,
+        "date_field": None,
+        "columns": [("Tool Code", "tool_code"), ("Name", "name"), ("Type", "tool_type"),
+                    ("Quantity Available", "quantity_available"), ("Minimum Stock", "minimum_stock"),
+                    ("Low Stock", "is_low_stock"), ("Unit Price", "unit_price"), ("Location", "location"),
+                    ("Active", "is_active")],
+        "references": {},
+    },
+    "procurement": {
+        "title": "Procurement",
+        "document": PurchaseOrderDoc,
+        "date_field": "order_date",
+        "columns": [("PO Number", "po_number"), ("Supplier", "supplier_name"), ("Item", "item"),
+                    ("Quantity", "quantity"), ("Order Date", "order_date"), ("Expected Date", "expected_date"),
+                    ("Status", "status")],
+        "references": {"item": (InventoryItemDoc, "name")},
+    },
+}
+
+DATE_RANGES = ("today", "week", "month", "quarter", "custom")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+
+
+def resolve_date_range(name, start=None, end=None, today=None):
+    """[date_from, date_to) for a date range of the Export modal.
+
+    custom uses start and end, both inclusive days. Raises ValueError for an
+    unknown range or an incomplete custom one."""
+    today = today or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+    if name == "today":
+        return today, tomorrow
+    if name == "week":
+        return today - timedelta(days=today.weekday()), tomorrow
+    if name == "month":
+        return today.replace(day=1), tomorrow
+    if name == "quarter":
+        return today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1), tomorrow
+    if name == "custom" and start and end and start <= end:
+        return start, end + timedelta(days=1)
+    raise ValueError(f"Unsupported date range: {name}")
+
+
+def _reference_names(references, batch):
+    """field -> {id: display name} for the references in one batch of raw documents"""
+    names = {}
+    for field, (doc_class, name_field) in references.items():
+        ids = list({raw.get(field) for raw in batch} - {None})
+        names[field] = {row["_id"]: row.get(name_field) for row in
+                        doc_class._get_collection().find({"_id": {"$in": ids}}, {name_field: 1})} if ids else {}
+    return names
+
+
+def iter_rows(report, date_from=None, date_to=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the report's rows in lists of at most batch_size, oldest first"""
+    spec = REPORTS[report]
+    fields = [field for _, field in spec["columns"]]
+    date_field = spec["date_field"]
+    query = {}
+    if date_field:
+        query[date_field] = {"$gte": date_from, "$lt": date_to}
+    cursor = spec["document"]._get_collection().find(
+        query, dict.fromkeys(fields, 1), sort=[(date_field or "_id", 1)], batch_size=batch_size)
+
+    references = spec["references"]
+    with cursor:
+        while True:
+            batch = list(islice(cursor, batch_size))
+            if not batch:
+                return
+            names = _reference_names(references, batch)
+            yield [[names[field].get(raw.get(field)) if field in references else raw.get(field)
+                    for field in fields] for raw in batch]
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M") if (value.hour or value.minute) else value.strftime("%Y-%m-%d")
+    return value
+
+
+def csv_chunks(header, batches, sheet_name=None):
+    """CSV bytes, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for rows in batches:
+        writer.writerows([_text(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# Minimal SpreadsheetML package: one worksheet of inline strings, no styles
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+_SHEET_HEAD = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+               b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_TAIL = b'</sheetData></worksheet>'
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xlsx_cell(value):
+    value = _text(value)
+    if isinstance(value, (int, float)):
+        return f"<c><v>{value}</v></c>"
+    if value == "":
+        return "<c/>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", str(value)))}</t></is></c>'
+
+
+def _xlsx_rows(rows):
+    return "".join("<row>" + "".join(_xlsx_cell(value) for value in row) + "</row>" for row in rows).encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file for zipfile that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def xlsx_chunks(header, batches, sheet_name="Report"):
+    """XLSX bytes, streamed: the worksheet is deflated into the zip batch by batch"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr("xl/workbook.xml", _XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_SHEET_HEAD + _xlsx_rows([header]))
+            for rows in batches:
+                sheet.write(_xlsx_rows(rows))
+                yield sink.drain()
+            sheet.write(_SHEET_TAIL)
+    yield sink.drain()
+
+
+# format -> (mimetype, writer)
+FORMATS = {
+    "csv": ("text/csv", csv_chunks),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", xlsx_chunks),
+}
+
+
+def export_chunks(report, fmt, batches):
+    """Encoded file contents for report rows in format fmt"""
+    spec = REPORTS[report]
+    header = [name for name, _ in spec["columns"]]
+    return FORMATS[fmt][1](header, batches, sheet_name=spec["title"])
+
+
+def export_filename(report, fmt, date_from=None, date_to=None):
+    if REPORTS[report]["date_field"] and date_from and date_to:
+        last_day = date_to - timedelta(days=1)
+        return f"{report}_{date_from:%Y%m%d}-{last_day:%Y%m%d}.{fmt}"
+    return f"{report}_{datetime.utcnow():%Y%m%d}.{fmt}"
+
+
+# ---------------- Background jobs ----------------
+def export_path(job):
+    return os.path.join(EXPORT_DIR, f"{job.id}.{job.format}")
+
+
+def start_export_job(report, fmt, date_from, date_to, user):
+    """Queue an export to run on a background thread; returns the ExportJobDoc"""
+    job = ExportJobDoc(report=report, format=fmt, date_from=date_from, date_to=date_to, created_by=user)
+    job.file_name = export_filename(report, fmt, date_from, date_to)
+    job.save()
+    _executor.submit(run_export_job, job.id)
+    return job
+
+
+def run_export_job(job_id):
+    jobs = ExportJobDoc.objects(id=job_id)
+    job = jobs.first()
+    jobs.update_one(set__status="Running")
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    path = export_path(job)
+    try:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            for chunk in export_chunks(job.report, job.format,
+                                       counted(iter_rows(job.report, job.date_from, job.date_to))):
+                f.write(chunk)
+        os.replace(path + ".part", path)
+        jobs.update_one(set__status="Completed", set__rows=rows, set__finished_at=datetime.utcnow())
+    except Exception as e:
+        print(f"⚠ Export job {job_id} failed: {e}")
+        jobs.update_one(set__status="Failed", set__error=str(e), set__finished_at=datetime.utcnow())
+    purge_exports()
+
+
+def purge_exports(older_than=EXPORT_RETENTION):
+    """Delete export jobs and their files once they are older than the retention period"""
+    cutoff = datetime.utcnow() - older_than
+    for job in ExportJobDoc.objects(created_at__lt=cutoff).only("format"):
+        for path in (export_path(job), export_path(job) + ".part"):
+            if os.path.exists(path):
+                os.remove(path)
+        job.delete()
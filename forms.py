@@ -100,6 +100,7 @@ class ProductForm(FlaskForm):
         ('Finished Goods', 'Finished Goods'),
         ('Consumables', 'Consumables')
     ])
+    item_id = SelectField('Stocked Item', coerce=str, validators=[Optional()])
     is_active = BooleanField('Active')
 
 
@@ -107,6 +108,8 @@ class ProductForm(FlaskForm):
 class GRNForm(FlaskForm):
     grn_number = StringField('GRN Number', validators=[DataRequired(), Length(max=20)])
     vendor_id = SelectField('Vendor', coerce=str, validators=[DataRequired()])
+    item_id = SelectField('Material Received', coerce=str, validators=[Optional()])
+    quantity = DecimalField('Quantity Received', validators=[Optional(), NumberRange(min=0)])
     received_date = DateField('Received Date', validators=[DataRequired()])
     invoice_number = StringField('Invoice Number', validators=[Optional(), Length(max=50)])
     total_amount = DecimalField('Total Amount', validators=[Optional(), NumberRange(min=0)])
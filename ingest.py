@@ -0,0 +1,246 @@
+"""Buffered ingestion of production entries from shop-floor terminals.
+
+Terminals post entries at hundreds per second around shift change. Each
+entry is validated without hydrating a Document: machine, operator and work
+order ids are checked against a per-process IdCache, which only goes to
+the database, once per batch, for ids it has not seen recently. Valid
+entries are queued in the process's EntryBuffer, and a background thread
+writes them with unordered insert_many once flush_size entries are waiting
+or flush_interval has passed, then add each batch's quantities to their
+work orders (progress.py). A full buffer makes add() wait briefly and then
+refuse, so the route can answer 503 instead of growing without bound.
+
+The buffer is flushed at interpreter exit; servers that stop workers
+without running atexit handlers (e.g. a gunicorn worker_exit hook) should
+call flush_production_entries() themselves.
+"""
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from models_mongo import EmployeeDoc, MachineDoc, ProductionEntryDoc, WorkOrderDoc
+from progress import add_produced
+
+FLUSH_SIZE = int(os.getenv("INGEST_FLUSH_SIZE", "500"))  # entries per insert_many
+FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1"))  # seconds an entry may wait for a flush
+BUFFER_LIMIT = int(os.getenv("INGEST_BUFFER_LIMIT", "20000"))  # entries held before add() pushes back
+BACKPRESSURE_TIMEOUT = 2  # seconds add() waits for room before giving up
+
+
+class BufferFull(Exception):
+    pass
+
+
+class IdCache:
+    """Recently confirmed ids of one collection, e.g. active machines.
+
+    Confirmed ids are trusted for ttl seconds; unknown ids are looked up in
+    one $in query per call, so a steady stream of entries costs no reads."""
+
+    def __init__(self, doc_class, ttl=300, max_size=50000, **filters):
+        self.doc_class = doc_class
+        self.ttl = ttl
+        self.max_size = max_size
+        self.filters = filters
+        self._seen = {}  # id -> monotonic time it was confirmed
+        self._lock = threading.Lock()
+
+    def valid(self, ids):
+        """The subset of ids that exist and match the filters"""
+        now = time.monotonic()
+        with self._lock:
+            known = {i for i in ids if now - self._seen.get(i, -self.ttl) < self.ttl}
+        missing = set(ids) - known
+        if missing:
+            query = self.doc_class.objects(id__in=list(missing), **self.filters)._query
+            found = {row["_id"] for row in self.doc_class._get_collection().find(query, {"_id": 1})}
+            with self._lock:
+                if len(self._seen) + len(found) > self.max_size:
+                    self._seen.clear()
+                self._seen.update(dict.fromkeys(found, now))
+            known |= found
+        return known
+
+
+machine_ids = IdCache(MachineDoc, is_active=True)
+operator_ids = IdCache(EmployeeDoc, is_active=True)
+work_order_ids = IdCache(WorkOrderDoc)
+
+
+def _object_id(value):
+    return ObjectId(value) if isinstance(value, str) and ObjectId.is_valid(value) else None
+
+
+def _parse_entry(row):
+    """(raw entry, None) or (None, error) for one posted entry, before id checks"""
+    if not hasattr(row, "get"):
+        return None, "Expected an object"
+    entry = {"machine": _object_id(row.get("machine")), "operator": _object_id(row.get("operator"))}
+    if entry["machine"] is None or entry["operator"] is None:
+        return None, "machine and operator must be ids"
+    if row.get("work_order"):
+        entry["work_order"] = _object_id(row.get("work_order"))
+        if entry["work_order"] is None:
+            return None, "work_order must be an id"
+
+    quantity = row.get("quantity_produced")
+    if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity < 0:
+        return None, "quantity_produced must be a non-negative number"
+    entry["quantity_produced"] = float(quantity)
+
+    shift = row.get("shift")
+    if not isinstance(shift, str) or not shift or len(shift) > 20:
+        return None, "shift is required (at most 20 characters)"
+    entry["shift"] = shift
+
+    try:
+        entry["date"] = datetime.fromisoformat(row["date"]) if row.get("date") else datetime.utcnow()
+    except (TypeError, ValueError):
+        return None, "date must be an ISO timestamp"
+    if row.get("remarks"):
+        entry["remarks"] = str(row["remarks"])
+    return entry, None
+
+
+def validate_entries(rows):
+    """Split posted rows into raw entries ready to insert and {row index: error}"""
+    parsed, errors = [], {}
+    for index, row in enumerate(rows):
+        entry, error = _parse_entry(row)
+        if error:
+            errors[index] = error
+        else:
+            parsed.append((index, entry))
+
+    machines = machine_ids.valid({entry["machine"] for _, entry in parsed})
+    operators = operator_ids.valid({entry["operator"] for _, entry in parsed})
+    work_orders = work_order_ids.valid({entry["work_order"] for _, entry in parsed if "work_order" in entry})
+
+    entries = []
+    for index, entry in parsed:
+        if entry["machine"] not in machines:
+            errors[index] = "Unknown or inactive machine"
+        elif entry["operator"] not in operators:
+            errors[index] = "Unknown or inactive operator"
+        elif "work_order" in entry and entry["work_order"] not in work_orders:
+            errors[index] = "Unknown work order"
+        else:
+            entries.append(entry)
+    return entries, errors
+
+
+class EntryBuffer:
+    """Per-process queue of raw production entries written in batches"""
+
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL, limit=BUFFER_LIMIT):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.limit = limit
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one insert_many at a time, in order
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._entries = []
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Called with _cond held; a forked worker starts its own flusher
+        if self._pid != os.getpid():
+            self._reset()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingest-flush", daemon=True)
+            self._thread.start()
+
+    def add(self, entries, timeout=BACKPRESSURE_TIMEOUT):
+        """Queue entries for the next flush; raises BufferFull if no room frees up within timeout"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._ensure_thread()
+            while len(self._entries) + len(entries) > self.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BufferFull()
+                self._cond.notify_all()  # let the flusher start early
+                self._cond.wait(remaining)
+            self._entries.extend(entries)
+            if len(self._entries) >= self.flush_size:
+                self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._entries)
+
+    def _take(self):
+        with self._cond:
+            batch, self._entries = self._entries, []
+            self._cond.notify_all()  # wake producers waiting for room
+            return batch
+
+    def flush(self):
+        """Write everything queued so far; returns the number of entries inserted"""
+        with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return 0
+            # created_at is the insert time, which the rollup watermark relies on
+            now = datetime.utcnow()
+            for entry in batch:
+                entry["created_at"] = now
+            written = batch
+            try:
+                ProductionEntryDoc._get_collection().insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # A duplicate _id is an entry already written by an earlier, interrupted
+                # attempt; that attempt never counted it towards its work order, so this one does
+                failed = {error["index"] for error in e.details["writeErrors"] if error["code"] != 11000}
+                if failed:
+                    print(f"⚠ {len(failed)} of {len(batch)} production entries were not written")
+                written = [entry for index, entry in enumerate(batch) if index not in failed]
+            except Exception as e:
+                # Database unavailable: keep the entries, with the _ids pymongo
+                # assigned, so the retry cannot write any of them twice
+                with self._cond:
+                    self._entries[:0] = batch
+                print(f"⚠ Production entry flush failed, will retry: {e}")
+                return 0
+            try:
+                add_produced(written)
+            except Exception as e:
+                print(f"⚠ Work order progress not updated for {len(written)} production entries "
+                      f"(run scripts/recompute_work_order_progress.py): {e}")
+            return len(written)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._pid != os.getpid():
+                    return
+                self._cond.wait_for(lambda: len(self._entries) >= self.flush_size, self.flush_interval)
+            self.flush()
+
+
+production_entries = EntryBuffer()
+
+
+def ingest_entries(rows):
+    """Validate and queue posted entries; returns (accepted count, {row index: error}).
+
+    Raises BufferFull when the buffer stays full for BACKPRESSURE_TIMEOUT."""
+    entries, errors = validate_entries(rows)
+    if entries:
+        production_entries.add(entries)
+    return len(entries), errors
+
+
+def flush_production_entries():
+    return production_entries.flush()
+
+
+atexit.register(flush_production_entries)
@@ -0,0 +1,108 @@
+"""Append-only inventory ledger with daily snapshots.
+
+Every receipt, issue and adjustment appends one stock_movements row; rows
+are never updated. take_snapshots() writes each item's balance at midnight
+for the items that moved that day, so the balance at any time is the
+item's latest snapshot before it plus the few movements posted since.
+stock_levels() answers that for a page of items with one aggregation over
+snapshots and one over movements.
+
+Balances are as of posting time (moved_at), not the source document's
+date, so a snapshot never has to change once written. Snapshots are only
+taken for midnights older than SETTLE_DELAY, as writes still in flight
+could otherwise be missed (see scripts/inventory_ledger.py).
+"""
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from models_mongo import RollupWatermarkDoc, StockMovementDoc, StockSnapshotDoc
+
+MOVEMENT_TYPES = ("Opening", "Receipt", "Issue", "Adjustment")
+WATERMARK_KEY = "stock_snapshots"
+SETTLE_DELAY = timedelta(seconds=30)
+SNAPSHOT_CHUNK = 1000  # items per stock_levels() call while snapshotting
+
+
+def record_movement(item_id, quantity, movement_type, reference=None, document_date=None, user=None):
+    """Append one movement to the ledger"""
+    movement = {"item": item_id, "quantity": float(quantity), "movement_type": movement_type,
+                "moved_at": datetime.utcnow()}
+    if reference:
+        movement["reference"] = str(reference)
+    if document_date:
+        if not isinstance(document_date, datetime):  # a form's date field
+            document_date = datetime.combine(document_date, datetime.min.time())
+        movement["document_date"] = document_date
+    if user is not None:
+        movement["created_by"] = getattr(user, "id", user)
+    StockMovementDoc._get_collection().insert_one(movement)
+    return movement
+
+
+def stock_levels(item_ids, as_of=None):
+    """item id -> quantity on hand at as_of (now by default).
+
+    Reads each item's latest snapshot at or before as_of, then sums only the
+    movements posted between that snapshot and as_of."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    as_of = as_of or datetime.utcnow()
+    base = {row["_id"]: row for row in StockSnapshotDoc._get_collection().aggregate([
+        {"$match": {"item": {"$in": item_ids}, "as_of": {"$lte": as_of}}},
+        {"$sort": {"item": 1, "as_of": -1}},
+        {"$group": {"_id": "$item", "as_of": {"$first": "$as_of"}, "quantity": {"$first": "$quantity"}}},
+    ])}
+
+    ranges = []
+    for item_id in item_ids:
+        moved_at = {"$lt": as_of}
+        if item_id in base:
+            moved_at["$gte"] = base[item_id]["as_of"]
+        ranges.append({"item": item_id, "moved_at": moved_at})
+    deltas = {row["_id"]: row["quantity"] for row in StockMovementDoc._get_collection().aggregate([
+        {"$match": {"$or": ranges}},
+        {"$group": {"_id": "$item", "quantity": {"$sum": "$quantity"}}},
+    ])}
+    return {item_id: (base[item_id]["quantity"] if item_id in base else 0) + deltas.get(item_id, 0)
+            for item_id in item_ids}
+
+
+def _snapshot(start, as_of):
+    """Write as_of balances for the items with movements posted in [start, as_of)"""
+    moved_at = {"$lt": as_of}
+    if start is not None:
+        moved_at["$gte"] = start
+    items = StockMovementDoc._get_collection().distinct("item", {"moved_at": moved_at})
+    snapshots = StockSnapshotDoc._get_collection()
+    for i in range(0, len(items), SNAPSHOT_CHUNK):
+        levels = stock_levels(items[i:i + SNAPSHOT_CHUNK], as_of)
+        snapshots.bulk_write([UpdateOne({"item": item_id, "as_of": as_of}, {"$set": {"quantity": quantity}},
+                                        upsert=True) for item_id, quantity in levels.items()], ordered=False)
+    return len(items)
+
+
+def take_snapshots(now=None):
+    """Snapshot every settled midnight since the previous run; returns the midnights taken"""
+    settled = (now or datetime.utcnow()) - SETTLE_DELAY
+    last_midnight = settled.replace(hour=0, minute=0, second=0, microsecond=0)
+    watermarks = RollupWatermarkDoc._get_collection()
+    state = watermarks.find_one({"_id": WATERMARK_KEY})
+    start = state.get("processed_until") if state else None
+
+    if start is None:
+        first = StockMovementDoc._get_collection().find_one({}, {"moved_at": 1}, sort=[("moved_at", 1)])
+        if first is None:
+            return []
+        day = first["moved_at"].replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    else:
+        day = start + timedelta(days=1)
+
+    taken = []
+    while day <= last_midnight:
+        _snapshot(start, day)
+        watermarks.update_one({"_id": WATERMARK_KEY}, {"$set": {"processed_until": day}}, upsert=True)
+        taken.append(day)
+        start, day = day, day + timedelta(days=1)
+    return taken
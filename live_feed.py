@@ -0,0 +1,138 @@
+"""Per-process live dashboard feed served as Server-Sent Events.
+
+A single background poller per process reads the cached dashboard stats and
+the work orders created since its previous poll, then fans the changes out
+to a queue per connected browser. However many screens are open, each
+worker runs one query loop, and it stops when the last subscriber leaves.
+
+Each stream closes after STREAM_MAX_SECONDS so that it does not hold a
+worker for as long as the page stays open; the browser's EventSource then
+reconnects after the retry delay sent at the start of the stream.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from mongoengine import Q
+
+from models_mongo import WorkOrderDoc
+from stats import dashboard_stats
+
+POLL_INTERVAL = int(os.getenv("LIVE_FEED_INTERVAL", "5"))  # seconds between upstream polls
+HEARTBEAT_INTERVAL = 15  # seconds of silence before a keep-alive comment is sent
+STREAM_MAX_SECONDS = int(os.getenv("LIVE_FEED_MAX_SECONDS", "300"))  # lifetime of one stream
+RECONNECT_DELAY_MS = 3000  # how long the browser waits before reopening a closed stream
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class LiveFeed:
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = None
+        self._last_seen = None  # (created_at, id) of the newest work order already announced
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self):
+        """Latest full stats seen by the poller, or None before its first poll"""
+        return self._stats
+
+    def publish(self, event, data):
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass  # Stalled client; it misses this event rather than holding up the others
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self._poll_stats()
+                self._poll_work_orders()
+            except Exception as e:
+                print(f"⚠ Live feed poll failed: {e}")
+            time.sleep(self.interval)
+
+    def _poll_stats(self):
+        stats = dashboard_stats()
+        if self._stats is None:
+            self.publish("stats", stats)
+        else:
+            delta = {key: value for key, value in stats.items() if self._stats.get(key) != value}
+            if delta:
+                self.publish("stats", delta)
+        self._stats = stats
+
+    def _poll_work_orders(self):
+        fields = ("work_order_number", "quantity", "quantity_produced", "status", "created_at")
+        if self._last_seen is None:
+            latest = WorkOrderDoc.objects().only(*fields).order_by('-created_at', '-id').first()
+            self._last_seen = (latest.created_at, latest.id) if latest else (datetime.min, None)
+            return
+
+        created_at, doc_id = self._last_seen
+        newer = Q(created_at__gt=created_at)
+        if doc_id is not None:
+            newer |= Q(created_at=created_at, id__gt=doc_id)
+        for wo in WorkOrderDoc.objects(newer).only(*fields).order_by('created_at', 'id').limit(50):
+            self.publish("work_order", {
+                "id": str(wo.id),
+                "work_order_number": wo.work_order_number,
+                "quantity": wo.quantity,
+                "quantity_produced": wo.quantity_produced,
+                "status": wo.status,
+                "created_at": wo.created_at.isoformat(),
+            })
+            self._last_seen = (wo.created_at, wo.id)
+
+
+live_feed = LiveFeed()
+
+
+def event_stream(feed=live_feed, max_seconds=STREAM_MAX_SECONDS):
+    """SSE generator for one browser: current stats, then changes as they
+    happen, for at most max_seconds"""
+    deadline = time.monotonic() + max_seconds
+    subscriber = feed.subscribe()
+    try:
+        yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+        snapshot = feed.snapshot()
+        if snapshot is not None:
+            yield format_event("stats", snapshot)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                yield subscriber.get(timeout=min(HEARTBEAT_INTERVAL, remaining))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+    finally:
+        feed.unsubscribe(subscriber)
@@ -2,10 +2,14 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from mongoengine import (
-    Document, StringField, EmailField, BooleanField, DateTimeField,
-    FloatField, ReferenceField, IntField
+    Document, EmbeddedDocument, StringField, EmailField, BooleanField, DateTimeField,
+    FloatField, ReferenceField, IntField, DictField, ListField, EmbeddedDocumentField
 )
 
+# Server-side form of ToolDoc's low stock rule, for $expr queries and pipeline updates
+LOW_STOCK_EXPR = {"$lte": ["$quantity_available", "$minimum_stock"]}
+
+
 # ==========================
 # USER & AUTHENTICATION
 # ==========================
@@ -32,6 +36,42 @@ class UserDoc(UserMixin, Document):
         return self.username
 
 
+# ==========================
+# SEQUENCES, COUNTERS & CACHE
+# ==========================
+class CounterDoc(Document):
+    key = StringField(primary_key=True, max_length=50)  # prefix + YYYYMMDD, e.g. WO20250101
+    seq = IntField(default=0)
+
+    meta = {"collection": "counters"}
+
+    def __str__(self):
+        return f"{self.key}: {self.seq}"
+
+
+class DashboardCounterDoc(Document):
+    key = StringField(primary_key=True, max_length=50)  # "dashboard"
+    counts = DictField()  # collection -> {bucket value: count}, maintained with $inc
+    rebuilt_at = DateTimeField()
+
+    meta = {"collection": "dashboard_counters"}
+
+    def __str__(self):
+        return self.key
+
+
+class CacheEntryDoc(Document):
+    key = StringField(primary_key=True, max_length=100)
+    value = DictField()
+    expires_at = DateTimeField()  # value is served stale after this
+    lease_until = DateTimeField()  # set while one worker refreshes the value
+
+    meta = {"collection": "cache_entries"}
+
+    def __str__(self):
+        return self.key
+
+
 # ==========================
 # MASTER DATA
 # ==========================
@@ -40,7 +80,7 @@ class DepartmentDoc(Document):
     is_active = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "departments", "indexes": ["name"]}
+    meta = {"collection": "departments", "indexes": ["name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
@@ -67,7 +107,7 @@ class EmployeeDoc(Document):
     is_active = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "employees", "indexes": ["code", "name"]}
+    meta = {"collection": "employees", "indexes": ["code", "name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
@@ -84,21 +124,28 @@ class MachineDoc(Document):
     is_active = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "machines", "indexes": ["machine_code", "name"]}
+    meta = {"collection": "machines", "indexes": ["machine_code", "name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
 
 
+class BOMLineDoc(EmbeddedDocument):
+    item = ReferenceField("InventoryItemDoc", required=True)  # component
+    quantity = FloatField(required=True)  # per unit of the parent item
+    scrap_rate = FloatField(default=0)  # fraction planned on top, e.g. 0.05
+
+
 class InventoryItemDoc(Document):
     code = StringField(required=True, unique=True, max_length=20)
     name = StringField(required=True, max_length=100)
     description = StringField()
     quantity = FloatField(default=0)
     unit = ReferenceField(UnitDoc)
+    bom = ListField(EmbeddedDocumentField(BOMLineDoc))  # components of one unit; empty for bought-in items
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "inventory_items", "indexes": ["code", "name"]}
+    meta = {"collection": "inventory_items", "indexes": ["code", "name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
@@ -111,13 +158,19 @@ class WorkOrderDoc(Document):
     work_order_number = StringField(required=True, unique=True, max_length=50)
     item = ReferenceField(InventoryItemDoc)
     quantity = FloatField(required=True)
+    quantity_produced = FloatField(default=0)  # sum of its production entries, kept by progress.py
     unit = ReferenceField(UnitDoc)
     start_date = DateTimeField()
     due_date = DateTimeField()
+    priority = StringField(default="Normal", max_length=20)  # Low / Normal / High / Urgent
     status = StringField(default="Pending", max_length=50)
     created_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)  # touched on every save, for list partial refreshes
+
+    meta = {"collection": "work_orders", "indexes": ["work_order_number", "status", ("-created_at", "-id"), "updated_at"]}
 
-    meta = {"collection": "work_orders", "indexes": ["work_order_number", "status"]}
+    def clean(self):
+        self.updated_at = datetime.utcnow()
 
     def __str__(self):
         return self.work_order_number
@@ -134,12 +187,50 @@ class ProductionEntryDoc(Document):
     remarks = StringField()
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "production_entries", "indexes": ["date", "shift"]}
+    meta = {"collection": "production_entries", "indexes": ["date", "shift", "created_at", ("-created_at", "-id")]}
 
     def __str__(self):
         return f"{self.work_order} - {self.date}"
 
 
+class ProductionRollupDoc(Document):
+    # _id is the bucket key: {granularity, bucket, machine, work_order, shift, operator}
+    id = DictField(primary_key=True)
+    granularity = StringField(max_length=10)  # hour / day
+    bucket = DateTimeField()  # start of the hour or day
+    machine = ReferenceField(MachineDoc)
+    work_order = ReferenceField(WorkOrderDoc)
+    shift = StringField(max_length=20)
+    operator = ReferenceField(EmployeeDoc)
+    quantity_produced = FloatField(default=0)
+    entries = IntField(default=0)
+
+    meta = {
+        "collection": "production_rollups",
+        "indexes": [
+            ("granularity", "bucket"),
+            ("granularity", "machine", "bucket"),
+            ("granularity", "work_order", "bucket"),
+            ("granularity", "operator", "bucket"),
+        ],
+    }
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket}"
+
+
+class RollupWatermarkDoc(Document):
+    key = StringField(primary_key=True, max_length=50)
+    processed_until = DateTimeField()  # entries created up to here are in the rollups
+    pending = DictField()  # {until, done: [granularities merged]} while a rollup run is folding
+    lease_until = DateTimeField()  # set while a run holds the watermark
+
+    meta = {"collection": "rollup_watermarks"}
+
+    def __str__(self):
+        return f"{self.key}: {self.processed_until}"
+
+
 # ==========================
 # MATERIALS & MAINTENANCE
 # ==========================
@@ -152,12 +243,42 @@ class MaterialIssueDoc(Document):
     date = DateTimeField()
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "material_issues", "indexes": ["date"]}
+    meta = {"collection": "material_issues", "indexes": ["date", ("-created_at", "-id")]}
 
     def __str__(self):
         return f"{self.item} - {self.quantity}"
 
 
+class StockMovementDoc(Document):
+    # Append-only inventory ledger: one row per receipt, issue or adjustment, never updated
+    item = ReferenceField(InventoryItemDoc, required=True)
+    quantity = FloatField(required=True)  # signed: receipts positive, issues negative
+    movement_type = StringField(required=True, max_length=20)  # Opening / Receipt / Issue / Adjustment
+    reference = StringField(max_length=100)  # GRN number, material issue id or adjustment reason
+    document_date = DateTimeField()  # business date of the source document
+    moved_at = DateTimeField(default=datetime.utcnow)  # posting time; balances are as of this
+    created_by = ReferenceField(UserDoc)
+
+    meta = {"collection": "stock_movements", "indexes": [("item", "moved_at"), "moved_at"]}
+
+    def __str__(self):
+        return f"{self.movement_type} {self.item} {self.quantity}"
+
+
+class StockSnapshotDoc(Document):
+    item = ReferenceField(InventoryItemDoc, required=True)
+    as_of = DateTimeField(required=True)  # midnight; balance of every movement posted before it
+    quantity = FloatField(default=0)
+
+    meta = {
+        "collection": "stock_snapshots",
+        "indexes": [{"fields": ("item", "-as_of"), "unique": True}],
+    }
+
+    def __str__(self):
+        return f"{self.item} @ {self.as_of}: {self.quantity}"
+
+
 class MaintenanceLogDoc(Document):
     machine = ReferenceField(MachineDoc)
     maintenance_date = DateTimeField()
@@ -166,7 +287,7 @@ class MaintenanceLogDoc(Document):
     performed_by = ReferenceField(EmployeeDoc)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "maintenance_logs", "indexes": ["maintenance_date", "maintenance_type"]}
+    meta = {"collection": "maintenance_logs", "indexes": ["maintenance_date", "maintenance_type", ("-created_at", "-id")]}
 
     def __str__(self):
         return f"{self.machine} - {self.maintenance_type}"
@@ -186,7 +307,12 @@ class PurchaseOrderDoc(Document):
     status = StringField(default="Pending", max_length=50)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "purchase_orders", "indexes": ["po_number", "status"]}
+    meta = {
+        "collection": "purchase_orders",
+        # Filtered lists sort on (-order_date, -created_at); created_at breaks ties within a day
+        "indexes": ["po_number", "status", ("-created_at", "-id"), ("status", "-order_date", "-created_at"),
+                    ("-order_date", "-created_at")],
+    }
 
     def __str__(self):
         return self.po_number
@@ -205,7 +331,7 @@ class CustomerDoc(Document):
     is_active = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "customers", "indexes": ["customer_code", "name"]}
+    meta = {"collection": "customers", "indexes": ["customer_code", "name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
@@ -224,7 +350,7 @@ class VendorDoc(Document):
     is_active = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "vendors", "indexes": ["vendor_code", "name"]}
+    meta = {"collection": "vendors", "indexes": ["vendor_code", "name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
@@ -239,9 +365,20 @@ class ToolDoc(Document):
     unit_price = FloatField()
     location = StringField(max_length=100)
     is_active = BooleanField(default=True)
+    is_low_stock = BooleanField(default=False)  # quantity_available <= minimum_stock, kept in sync on save
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "tools", "indexes": ["tool_code", "name"]}
+    meta = {"collection": "tools", "indexes": ["tool_code", "name", ("-created_at", "-id"), "is_low_stock"]}
+
+    def clean(self):
+        self.is_low_stock = (self.quantity_available or 0) <= (self.minimum_stock or 0)
+
+    @classmethod
+    def refresh_low_stock(cls, **filters):
+        """Recompute is_low_stock in the database for matching tools, e.g. after
+        quantity_available was changed with an atomic update instead of save()"""
+        query = cls.objects(**filters)._query
+        return cls._get_collection().update_many(query, [{"$set": {"is_low_stock": LOW_STOCK_EXPR}}]).modified_count
 
     def __str__(self):
         return self.name
@@ -253,10 +390,11 @@ class ProductDoc(Document):
     unit_of_measure = StringField(required=True, max_length=10)
     standard_price = FloatField()
     product_type = StringField(max_length=50)
+    item = ReferenceField(InventoryItemDoc)  # stocked item the product is made as; its BOM drives MRP
     is_active = BooleanField(default=True)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "products", "indexes": ["product_code", "name"]}
+    meta = {"collection": "products", "indexes": ["product_code", "name", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.name
@@ -275,7 +413,10 @@ class InspectionDoc(Document):
     remarks = StringField()
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "inspections", "indexes": ["inspection_number", "status"]}
+    meta = {
+        "collection": "inspections",
+        "indexes": ["inspection_number", "status", ("-created_at", "-id"), "inspection_date"],
+    }
 
     def __str__(self):
         return self.inspection_number
@@ -291,7 +432,12 @@ class SalesOrderDoc(Document):
     created_by_user = ReferenceField(UserDoc)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "sales_orders", "indexes": ["order_number", "status"]}
+    meta = {
+        "collection": "sales_orders",
+        # Filtered lists sort on (-order_date, -created_at); created_at breaks ties within a day
+        "indexes": ["order_number", "status", ("-created_at", "-id"),
+                    ("status", "priority", "-order_date", "-created_at"), ("-order_date", "-created_at")],
+    }
 
     def __str__(self):
         return self.order_number
@@ -309,7 +455,7 @@ class ToolIssuanceDoc(Document):
     status = StringField(default="Issued", max_length=50)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "tool_issuances", "indexes": ["issue_number", "status"]}
+    meta = {"collection": "tool_issuances", "indexes": ["issue_number", "status", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.issue_number
@@ -318,15 +464,26 @@ class JobCardDoc(Document):
     job_card_number = StringField(required=True, unique=True, max_length=50)
     work_order = ReferenceField(WorkOrderDoc)
     machine = ReferenceField(MachineDoc)
+    machine_type = StringField(max_length=50)  # type of machine the operation needs; defaults to machine's
     operator = ReferenceField(EmployeeDoc)
     operation_description = StringField(required=True)
     standard_time = FloatField()
     actual_time = FloatField()
     quantity_completed = IntField(default=0)
     status = StringField(default="Assigned", max_length=50)
+    planned_start = DateTimeField()  # planned_start/planned_end/sequence are written by scheduler.py
+    planned_end = DateTimeField()
+    sequence = IntField()  # position in the machine's planned queue
     created_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)  # touched on every save, for list partial refreshes
 
-    meta = {"collection": "job_cards", "indexes": ["job_card_number", "status"]}
+    meta = {
+        "collection": "job_cards",
+        "indexes": ["job_card_number", "status", ("-created_at", "-id"), "updated_at", ("machine", "sequence")],
+    }
+
+    def clean(self):
+        self.updated_at = datetime.utcnow()
 
     def __str__(self):
         return self.job_card_number
@@ -334,13 +491,37 @@ class JobCardDoc(Document):
 class GRNDoc(Document):
     grn_number = StringField(required=True, unique=True, max_length=50)
     vendor = ReferenceField(VendorDoc)
+    item = ReferenceField(InventoryItemDoc)
+    quantity = FloatField()  # quantity of item received, booked to the inventory ledger
     received_date = DateTimeField()
     invoice_number = StringField(max_length=50)
     total_amount = FloatField()
     status = StringField(default="Received", max_length=50)
     created_at = DateTimeField(default=datetime.utcnow)
 
-    meta = {"collection": "grns", "indexes": ["grn_number", "status"]}
+    meta = {"collection": "grns", "indexes": ["grn_number", "status", ("-created_at", "-id")]}
 
     def __str__(self):
         return self.grn_number
+
+
+# ==========================
+# REPORTS
+# ==========================
+class ExportJobDoc(Document):
+    report = StringField(required=True, max_length=50)  # production / quality / inventory / procurement
+    format = StringField(required=True, max_length=10)  # csv / xlsx
+    date_from = DateTimeField()
+    date_to = DateTimeField()  # exclusive
+    status = StringField(default="Queued", max_length=20)  # Queued / Running / Completed / Failed
+    file_name = StringField(max_length=200)
+    rows = IntField(default=0)
+    error = StringField()
+    created_by = ReferenceField(UserDoc)
+    created_at = DateTimeField(default=datetime.utcnow)
+    finished_at = DateTimeField()
+
+    meta = {"collection": "export_jobs", "indexes": [("created_by", "-created_at")]}
+
+    def __str__(self):
+        return f"{self.report} {self.format} ({self.status})"
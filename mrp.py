@@ -0,0 +1,154 @@
+"""Material requirements planning over the multi-level bill of materials.
+
+explode_requirements() computes net requirements for all open work orders
+at once. Work order demand is summed per item with one $group, then the
+BOM graph is processed level by level in low-level-code order (the deepest
+level an item appears at in any BOM). Every item is netted exactly once,
+after all of its parents have added their demand, and each level is
+exploded as a whole into the next one's gross requirements instead of
+recursing per order or per BOM path.
+
+Net requirements are gross demand less on-hand stock and the quantity on
+open purchase orders. Items with a BOM are made, the rest are bought.
+"""
+from collections import defaultdict
+
+from models_mongo import InventoryItemDoc, PurchaseOrderDoc, WorkOrderDoc
+
+CLOSED_WORK_ORDER_STATUSES = ("Completed", "Cancelled")
+CLOSED_PO_STATUSES = ("Delivered", "Closed", "Cancelled")
+
+
+class BOMCycleError(ValueError):
+    def __init__(self, items):
+        super().__init__(f"BOM contains a cycle through {len(items)} item(s)")
+        self.items = items
+
+
+def load_boms():
+    """parent item id -> [(component id, quantity per parent including scrap)]"""
+    boms = {}
+    for raw in InventoryItemDoc._get_collection().find({"bom.0": {"$exists": True}}, {"bom": 1}):
+        boms[raw["_id"]] = [(line["item"], line["quantity"] * (1 + (line.get("scrap_rate") or 0)))
+                            for line in raw["bom"]]
+    return boms
+
+
+def low_level_codes(boms):
+    """item id -> deepest BOM level it appears at (0 for top-level items).
+
+    Walks the graph in topological order; raises BOMCycleError when an item
+    is, directly or indirectly, a component of itself."""
+    indegree = defaultdict(int)
+    for parent, lines in boms.items():
+        indegree[parent] += 0
+        for component, _ in lines:
+            indegree[component] += 1
+    levels = {item: 0 for item, n in indegree.items() if n == 0}
+    ready = list(levels)
+    visited = 0
+    while ready:
+        item = ready.pop()
+        visited += 1
+        for component, _ in boms.get(item, ()):
+            levels[component] = max(levels.get(component, 0), levels[item] + 1)
+            indegree[component] -= 1
+            if indegree[component] == 0:
+                ready.append(component)
+    if visited < len(indegree):
+        raise BOMCycleError([item for item, n in indegree.items() if n > 0])
+    return levels
+
+
+def explode(orders, boms, available, levels=None):
+    """Net requirements for make orders over the BOM graph.
+
+    orders: item -> quantity being made by open work orders; their
+    components are required in full. available: item -> stock that can be
+    netted (on hand plus on order). Returns item -> (level, gross, net, make),
+    where make is what has to be made of the item, orders included."""
+    levels = levels if levels is not None else low_level_codes(boms)
+    gross = defaultdict(float)
+    by_level = defaultdict(set)
+    for item in set(orders) | set(levels):
+        by_level[levels.get(item, 0)].add(item)
+
+    result = {}
+    for level in sorted(by_level):
+        # Net the whole level, then explode what it makes into the next levels' gross demand
+        make = {}
+        for item in by_level[level]:
+            needed = gross.get(item, 0.0)
+            net = max(0.0, needed - available.get(item, 0.0))
+            to_make = orders.get(item, 0.0) + (net if item in boms else 0.0)
+            if needed or to_make:
+                result[item] = (level, needed, net, to_make)
+            if to_make:
+                make[item] = to_make
+        for item, quantity in make.items():
+            for component, per_unit in boms.get(item, ()):
+                gross[component] += quantity * per_unit
+    return result
+
+
+def open_work_order_demand():
+    """item id -> quantity open work orders still have to make of it"""
+    remaining = {"$max": [{"$subtract": ["$quantity", {"$ifNull": ["$quantity_produced", 0]}]}, 0]}
+    pipeline = [
+        {"$match": {"item": {"$ne": None}}},
+        {"$group": {"_id": "$item", "quantity": {"$sum": remaining}}},
+    ]
+    return {row["_id"]: row["quantity"]
+            for row in WorkOrderDoc.objects(status__nin=CLOSED_WORK_ORDER_STATUSES).aggregate(pipeline)}
+
+
+def open_purchase_quantities():
+    """item id -> quantity on open purchase orders"""
+    pipeline = [
+        {"$match": {"item": {"$ne": None}}},
+        {"$group": {"_id": "$item", "quantity": {"$sum": "$quantity"}}},
+    ]
+    return {row["_id"]: row["quantity"]
+            for row in PurchaseOrderDoc.objects(status__nin=CLOSED_PO_STATUSES).aggregate(pipeline)}
+
+
+def explode_requirements():
+    """Requirements of every item needed by open work orders, by level then item code.
+
+    Each row has item id, code, name, level, gross, on_hand, on_order, net
+    and action (make or buy)."""
+    orders = open_work_order_demand()
+    boms = load_boms()
+    levels = low_level_codes(boms)
+    on_order = open_purchase_quantities()
+
+    ids = list(set(orders) | set(levels))
+    items = {raw["_id"]: raw for raw in
+             InventoryItemDoc._get_collection().find({"_id": {"$in": ids}}, {"code": 1, "name": 1, "quantity": 1})}
+    on_hand = {item_id: raw.get("quantity") or 0 for item_id, raw in items.items()}
+    available = {item_id: on_hand.get(item_id, 0) + on_order.get(item_id, 0) for item_id in ids}
+
+    rows = []
+    for item_id, (level, gross, net, make) in explode(orders, boms, available, levels).items():
+        item = items.get(item_id, {})
+        rows.append({
+            "item": str(item_id),
+            "code": item.get("code"),
+            "name": item.get("name"),
+            "level": level,
+            "gross": round(gross, 4),
+            "on_hand": on_hand.get(item_id, 0),
+            "on_order": on_order.get(item_id, 0),
+            "net": round(net, 4),
+            "make": round(make, 4),
+            "action": "make" if item_id in boms else "buy",
+        })
+    rows.sort(key=lambda row: (row["level"], row["code"] or ""))
+    return rows
+
+
+def check_bom(item_id, components):
+    """Raise BOMCycleError if giving item_id these [(component id, quantity)] would create a cycle"""
+    boms = load_boms()
+    boms[item_id] = components
+    low_level_codes(boms)
@@ -0,0 +1,67 @@
+"""Work order progress kept in WorkOrderDoc.quantity_produced.
+
+Every production entry insert adds its quantity to its work order with a
+$inc (add_produced), one update per work order per batch, so the work order
+list, dashboard and reports read a stored field instead of summing entries.
+The $inc also touches updated_at, so open lists pick the new progress up
+on their next partial refresh.
+
+The insert and the $inc are separate writes; if a process dies between the
+two, recompute_produced() rebuilds the field from the entries (see
+scripts/recompute_work_order_progress.py).
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from models_mongo import ProductionEntryDoc, WorkOrderDoc
+
+RECOMPUTE_BATCH = 1000  # work order updates per bulk_write while recomputing
+
+
+def add_produced(entries):
+    """Add the quantity of newly inserted raw entries to their work orders; returns work orders updated"""
+    totals = defaultdict(float)
+    for entry in entries:
+        if entry.get("work_order") is not None and entry.get("quantity_produced"):
+            totals[entry["work_order"]] += entry["quantity_produced"]
+    if not totals:
+        return 0
+    now = datetime.utcnow()
+    WorkOrderDoc._get_collection().bulk_write([
+        UpdateOne({"_id": work_order}, {"$inc": {"quantity_produced": quantity}, "$set": {"updated_at": now}})
+        for work_order, quantity in totals.items()], ordered=False)
+    return len(totals)
+
+
+def produced_totals():
+    """work order id -> sum of quantity_produced over its entries, with one $group"""
+    pipeline = [
+        {"$match": {"work_order": {"$ne": None}}},
+        {"$group": {"_id": "$work_order", "quantity": {"$sum": {"$ifNull": ["$quantity_produced", 0]}}}},
+    ]
+    return {row["_id"]: row["quantity"] for row in ProductionEntryDoc._get_collection().aggregate(pipeline)}
+
+
+def recompute_produced():
+    """Reset quantity_produced on every work order whose stored value differs
+    from its entries; returns the number corrected.
+
+    Entries inserted while this runs can be counted twice or not at all, so
+    run it while ingestion is quiet."""
+    totals = produced_totals()
+    work_orders = WorkOrderDoc._get_collection()
+    now = datetime.utcnow()
+    corrected, updates = 0, []
+    for row in work_orders.find({}, {"quantity_produced": 1}):
+        quantity = totals.get(row["_id"], 0)
+        if row.get("quantity_produced") != quantity:
+            updates.append(UpdateOne({"_id": row["_id"]},
+                                     {"$set": {"quantity_produced": quantity, "updated_at": now}}))
+        if len(updates) >= RECOMPUTE_BATCH:
+            corrected += work_orders.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        corrected += work_orders.bulk_write(updates, ordered=False).modified_count
+    return corrected
@@ -0,0 +1,190 @@
+"""Hourly and daily production rollups built from ProductionEntryDoc.
+
+rollup_production() folds the entries created since its previous run into
+production_rollups buckets keyed by (granularity, bucket, machine,
+work_order, shift, operator), using one $group + $merge pipeline per
+granularity. Reports then read a handful of bucket documents per day
+instead of scanning raw entries. rebuild_rollups() recomputes everything
+(see scripts/rollup_production.py).
+
+Runs belong on a schedule (scripts/rollup_production.py from cron). Reads
+never fold entries themselves: refresh_if_stale() only starts a run on a
+background thread when the watermark has fallen behind, and the caller
+reads the buckets as they are.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models_mongo import (EmployeeDoc, MachineDoc, ProductionEntryDoc, ProductionRollupDoc,
+                          RollupWatermarkDoc, WorkOrderDoc)
+
+GRANULARITIES = ("hour", "day")
+GROUP_FIELDS = ("machine", "work_order", "shift", "operator")
+WATERMARK_KEY = "production_rollups"
+
+# Entries younger than this are left for the next run so that writes still
+# in flight when a run starts are not skipped
+SETTLE_DELAY = timedelta(seconds=30)
+
+# How long a run may hold the watermark before another worker may take over
+LEASE = timedelta(minutes=15)
+
+# A read that finds the watermark further behind than this (beyond the
+# settle delay) starts a background run
+REFRESH_AFTER = timedelta(minutes=2)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rollups")
+_refreshing = threading.Lock()  # held while this process has a background run queued or running
+
+# group_by field -> (document, field used as its display name)
+GROUP_NAMES = {
+    "machine": (MachineDoc, "name"),
+    "work_order": (WorkOrderDoc, "work_order_number"),
+    "operator": (EmployeeDoc, "name"),
+}
+
+
+def _rollup_pipeline(granularity, match):
+    key = {
+        "granularity": granularity,
+        "bucket": {"$dateTrunc": {"date": {"$ifNull": ["$date", "$created_at"]}, "unit": granularity}},
+    }
+    key.update({field: f"${field}" for field in GROUP_FIELDS})
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": key,
+            "quantity_produced": {"$sum": {"$ifNull": ["$quantity_produced", 0]}},
+            "entries": {"$sum": 1},
+        }},
+        {"$set": {name: f"$_id.{name}" for name in ("granularity", "bucket") + GROUP_FIELDS}},
+        {"$merge": {
+            "into": ProductionRollupDoc._get_collection_name(),
+            "on": "_id",
+            "whenMatched": [{"$set": {
+                "quantity_produced": {"$add": ["$quantity_produced", "$$new.quantity_produced"]},
+                "entries": {"$add": ["$entries", "$$new.entries"]},
+            }}],
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def _fold(granularity, start, end):
+    """Add entries created in (start, end] to one granularity's buckets"""
+    created = {"$lte": end}
+    if start is not None:
+        created["$gt"] = start
+    ProductionEntryDoc._get_collection().aggregate(_rollup_pipeline(granularity, {"created_at": created}))
+
+
+def rollup_production(now=None):
+    """Fold entries created since the last run into the rollups.
+
+    A lease on the watermark document lets one run at a time fold, so no
+    entry is counted twice by concurrent workers. The range being folded
+    is recorded as pending with the granularities already merged, and the
+    watermark only moves once every granularity is in; a run that failed
+    part way is resumed by the next one without re-merging what it did.
+    Returns the new watermark, or None when another run holds the lease.
+    """
+    watermarks = RollupWatermarkDoc._get_collection()
+    taken_at = datetime.utcnow()
+    lease_until = (taken_at + LEASE).replace(microsecond=0)  # compared after a round trip, so no sub-ms part
+    try:
+        state = watermarks.find_one_and_update(
+            {"_id": WATERMARK_KEY, "$or": [{"lease_until": None}, {"lease_until": {"$lt": taken_at}}]},
+            {"$set": {"lease_until": lease_until}}, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        return None  # the document exists and its lease is held
+
+    start = state.get("processed_until")
+    try:
+        pending = state.get("pending")
+        if pending:
+            end, done = pending["until"], pending["done"]
+        else:
+            end, done = (now or datetime.utcnow()) - SETTLE_DELAY, []
+            if start is not None and start >= end:
+                return start
+            watermarks.update_one({"_id": WATERMARK_KEY}, {"$set": {"pending": {"until": end, "done": done}}})
+
+        for granularity in GRANULARITIES:
+            if granularity not in done:
+                _fold(granularity, start, end)
+                watermarks.update_one({"_id": WATERMARK_KEY}, {"$push": {"pending.done": granularity}})
+
+        watermarks.update_one({"_id": WATERMARK_KEY}, {"$set": {"processed_until": end}, "$unset": {"pending": ""}})
+        return end
+    finally:
+        watermarks.update_one({"_id": WATERMARK_KEY, "lease_until": lease_until}, {"$unset": {"lease_until": ""}})
+
+
+def _background_rollup():
+    try:
+        rollup_production()
+    except Exception as e:
+        # The watermark has not moved; the next stale read retries
+        print(f"⚠ Production rollup failed: {e}")
+    finally:
+        _refreshing.release()
+
+
+def refresh_if_stale(now=None):
+    """Start a background rollup run if the watermark is behind and no run
+    holds the lease. Never blocks; returns the current watermark (None
+    before the first run)."""
+    now = now or datetime.utcnow()
+    state = RollupWatermarkDoc._get_collection().find_one(
+        {"_id": WATERMARK_KEY}, {"processed_until": 1, "lease_until": 1}) or {}
+    processed_until = state.get("processed_until")
+    stale = processed_until is None or processed_until < now - SETTLE_DELAY - REFRESH_AFTER
+    leased = state.get("lease_until") is not None and state["lease_until"] > now
+    if stale and not leased and _refreshing.acquire(blocking=False):
+        _executor.submit(_background_rollup)
+    return processed_until
+
+
+def rebuild_rollups():
+    """Drop every bucket and fold all entries again, e.g. after entries were edited"""
+    ProductionRollupDoc._get_collection().delete_many({})
+    RollupWatermarkDoc._get_collection().delete_one({"_id": WATERMARK_KEY})
+    return rollup_production()
+
+
+def production_summary(date_from, date_to, group_by=None, granularity="day"):
+    """Quantity produced per bucket in [date_from, date_to), optionally split by group_by.
+
+    group_by is one of machine, work_order, shift or operator. Each row has
+    bucket, quantity_produced, entries and, when grouped, the group's id and
+    display name.
+    """
+    group = {"bucket": "$bucket"}
+    if group_by:
+        group[group_by] = f"${group_by}"
+    pipeline = [
+        {"$match": {"granularity": granularity, "bucket": {"$gte": date_from, "$lt": date_to}}},
+        {"$group": {
+            "_id": group,
+            "quantity_produced": {"$sum": "$quantity_produced"},
+            "entries": {"$sum": "$entries"},
+        }},
+        {"$sort": {"_id.bucket": 1}},
+    ]
+    rows = [dict(row["_id"], quantity_produced=row["quantity_produced"], entries=row["entries"])
+            for row in ProductionRollupDoc._get_collection().aggregate(pipeline)]
+
+    if group_by in GROUP_NAMES:
+        doc_class, name_field = GROUP_NAMES[group_by]
+        ids = {row.get(group_by) for row in rows} - {None}
+        names = {doc.id: getattr(doc, name_field)
+                 for doc in doc_class.objects(id__in=list(ids)).only(name_field)}
+        for row in rows:
+            ref = row.get(group_by)
+            row["name"] = names.get(ref)
+            row[group_by] = str(ref) if ref is not None else None
+    return rows
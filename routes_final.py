@@ -1,4 +1,5 @@
-from flask import Blueprint, redirect, render_template, request, jsonify, url_for, flash
+from flask import (Blueprint, Response, abort, redirect, render_template, request, jsonify, send_file,
+                   stream_with_context, url_for, flash)
 from flask_login import login_required, current_user
 from forms import (CustomerForm, WorkOrderForm, EmployeeForm, MachineForm,
                    ToolForm, VendorForm, ProductForm, QualityInspectionForm,
@@ -7,10 +8,25 @@ from forms import (CustomerForm, WorkOrderForm, EmployeeForm, MachineForm,
 from models_mongo import (EmployeeDoc, MachineDoc, WorkOrderDoc,
                         InventoryItemDoc, CustomerDoc, ProductDoc, GRNDoc,
                             InspectionDoc, ToolIssuanceDoc, JobCardDoc,
-                         PurchaseOrderDoc, SalesOrderDoc, ToolDoc, VendorDoc, DepartmentDoc)
-
-from utils import SimplePagination
-from datetime import datetime
+                         PurchaseOrderDoc, SalesOrderDoc, ToolDoc, VendorDoc, DepartmentDoc, ExportJobDoc,
+                         ProductionEntryDoc, MaterialIssueDoc, MaintenanceLogDoc)
+
+from exports import (DATE_RANGES, FORMATS, REPORTS, export_chunks, export_filename, export_path, iter_rows,
+                     resolve_date_range, start_export_job)
+from serializers import RawSerializer, Ref
+from utils import QuerySetPagination, KeysetPagination, bulk_insert, ndjson_lines, prefetch_references
+from sequences import CODE_FIELDS, buffered_codes, next_code
+from ingest import BufferFull, ingest_entries
+from live_feed import event_stream
+from rollups import GRANULARITIES, GROUP_FIELDS, production_summary, refresh_if_stale
+from ledger import stock_levels
+from mrp import BOMCycleError, check_bom, explode_requirements
+from scheduler import plan_job_cards
+from stock import (InsufficientStock, adjust_inventory, adjust_stock, issue_material, issue_tool, receive_stock,
+                   return_tool)
+from stats import dashboard_stats, reports_stats, low_stock_tools, record_created, record_changed
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
 
 # Additional Models that are missing from models_mongo.py
 
@@ -37,6 +53,7 @@ def get_status_badge_class(status):
         'Failed': 'bg-danger',
         'Issued': 'bg-warning',
         'Fully Returned': 'bg-success',
+        'Partially Returned': 'bg-info',
         'Assigned': 'bg-info',
         'Scheduled': 'bg-primary'
     }
@@ -60,15 +77,291 @@ def utility_processor():
         moment=lambda: type('MockMoment', (), {'date': lambda: datetime.now().date()})()
     )
 
+# Columns each list template renders; list queries load only these fields
+LIST_FIELDS = {
+    'customers_list': ('customer_code', 'name', 'contact_person', 'phone', 'email', 'city', 'is_active', 'created_at'),
+    'employees_list': ('code', 'name', 'phone', 'role', 'department', 'is_active', 'created_at'),
+    'machines_list': ('machine_code', 'name', 'machine_type', 'manufacturer', 'is_active', 'created_at'),
+    'tools_list': ('tool_code', 'name', 'tool_type', 'quantity_available', 'minimum_stock', 'unit_price',
+                   'location', 'is_active', 'is_low_stock', 'created_at'),
+    'vendors_list': ('vendor_code', 'name', 'contact_person', 'phone', 'email', 'city', 'is_active', 'created_at'),
+    'products_list': ('product_code', 'name', 'product_type', 'unit_of_measure', 'standard_price', 'is_active',
+                      'created_at'),
+    'work_orders_list': ('work_order_number', 'item', 'quantity', 'quantity_produced', 'start_date', 'due_date',
+                         'priority', 'status', 'created_at'),
+    'inspections_list': ('inspection_number', 'inspection_type', 'product', 'inspector', 'quantity_inspected',
+                         'quantity_accepted', 'quantity_rejected', 'inspection_date', 'status', 'created_at'),
+    'purchase_orders_list': ('po_number', 'supplier_name', 'order_date', 'expected_date', 'status', 'created_at'),
+    'sales_orders_list': ('order_number', 'customer', 'order_date', 'delivery_date', 'total_amount', 'priority',
+                          'status', 'created_by_user', 'created_at'),
+    'tool_issuances_list': ('issue_number', 'tool', 'employee', 'work_order', 'quantity_issued', 'quantity_returned',
+                            'issue_date', 'expected_return_date', 'status', 'created_at'),
+    'job_cards_list': ('job_card_number', 'work_order', 'machine', 'operator', 'operation_description',
+                       'standard_time', 'actual_time', 'quantity_completed', 'status', 'planned_start',
+                       'created_at'),
+    'inventory_raw_materials': ('code', 'name', 'quantity', 'created_at'),
+    'departments_list': ('name', 'is_active', 'created_at'),
+}
+
+# Fields rendered from referenced documents, resolved in one batch per page
+LIST_REFERENCES = {
+    'employees_list': {'department': ('name',)},
+    'work_orders_list': {'item': ('name',)},
+    'inspections_list': {'product': ('name',), 'inspector': ('name',)},
+    'sales_orders_list': {'customer': ('name',), 'created_by_user': ('username',)},
+    'tool_issuances_list': {'tool': ('name',), 'employee': ('name',), 'work_order': ('work_order_number',)},
+    'job_cards_list': {'work_order': ('work_order_number',), 'machine': ('name',), 'operator': ('name',)},
+}
+
+# Collections served by /api/<collection> and the fields of each record;
+# references are returned as ids
+API_COLLECTIONS = {
+    'departments': (DepartmentDoc, ('name', 'is_active', 'created_at')),
+    'customers': (CustomerDoc, ('customer_code', 'name', 'contact_person', 'phone', 'email', 'address', 'city',
+                                'state', 'country', 'postal_code', 'is_active', 'created_at')),
+    'vendors': (VendorDoc, ('vendor_code', 'name', 'contact_person', 'phone', 'email', 'address', 'city',
+                            'state', 'country', 'postal_code', 'is_active', 'created_at')),
+    'products': (ProductDoc, ('product_code', 'name', 'description', 'unit_of_measure', 'standard_price',
+                              'product_type', 'item', 'is_active', 'created_at')),
+    'tools': (ToolDoc, ('tool_code', 'name', 'tool_type', 'specification', 'quantity_available', 'minimum_stock',
+                        'unit_price', 'location', 'is_active', 'is_low_stock', 'created_at')),
+    'inventory_items': (InventoryItemDoc, ('code', 'name', 'description', 'quantity', 'unit', 'created_at')),
+    'work_orders': (WorkOrderDoc, ('work_order_number', 'item', 'quantity', 'quantity_produced', 'unit',
+                                   'start_date', 'due_date', 'priority', 'status', 'created_at', 'updated_at')),
+    'job_cards': (JobCardDoc, ('job_card_number', 'work_order', 'machine', 'machine_type', 'operator',
+                               'operation_description', 'standard_time', 'actual_time', 'quantity_completed',
+                               'status', 'planned_start', 'planned_end', 'sequence', 'created_at', 'updated_at')),
+    'production_entries': (ProductionEntryDoc, ('work_order', 'machine', 'operator', 'date', 'shift',
+                                                'quantity_produced', 'unit', 'remarks', 'created_at')),
+    'material_issues': (MaterialIssueDoc, ('work_order', 'item', 'quantity', 'unit', 'issued_to', 'date',
+                                           'created_at')),
+    'maintenance_logs': (MaintenanceLogDoc, ('machine', 'maintenance_date', 'maintenance_type', 'remarks',
+                                             'performed_by', 'created_at')),
+    'inspections': (InspectionDoc, ('inspection_number', 'inspection_type', 'product', 'work_order',
+                                    'quantity_inspected', 'quantity_accepted', 'quantity_rejected', 'inspector',
+                                    'inspection_date', 'status', 'remarks', 'created_at')),
+    'purchase_orders': (PurchaseOrderDoc, ('po_number', 'supplier_name', 'item', 'quantity', 'unit', 'order_date',
+                                           'expected_date', 'status', 'created_at')),
+    'grns': (GRNDoc, ('grn_number', 'vendor', 'item', 'quantity', 'received_date', 'invoice_number',
+                      'total_amount', 'status', 'created_at')),
+    'sales_orders': (SalesOrderDoc, ('order_number', 'customer', 'order_date', 'delivery_date', 'total_amount',
+                                     'priority', 'status', 'created_by_user', 'created_at')),
+    'tool_issuances': (ToolIssuanceDoc, ('issue_number', 'tool', 'employee', 'work_order', 'quantity_issued',
+                                         'quantity_returned', 'issue_date', 'expected_return_date',
+                                         'actual_return_date', 'status', 'created_at')),
+}
+
+# JSON API records, serialized from raw documents (see serializers.py)
+MACHINE_JSON = RawSerializer({
+    "id": "_id",
+    "machine_code": "machine_code",
+    "name": "name",
+    "machine_type": "machine_type",
+    "manufacturer": ("manufacturer", ""),
+    "model": ("model", ""),
+})
+EMPLOYEE_JSON = RawSerializer({
+    "id": "_id",
+    "employee_code": "code",
+    "name": "name",
+    "department": Ref("department", DepartmentDoc, "name"),
+    "role": ("role", "Operator"),
+})
+API_SERIALIZERS = {name: (doc_class, RawSerializer.for_document(doc_class, fields))
+                   for name, (doc_class, fields) in API_COLLECTIONS.items()}
+
+# Create APIs: collection -> (document, code prefix, payload key -> document field).
+# Rows without a code get one from the prefix's sequence.
+BULK_CREATE_LIMIT = 5000
+CREATE_FIELDS = {
+    'machines': (MachineDoc, 'MCH', {'machine_code': 'machine_code', 'name': 'name', 'machine_type': 'machine_type',
+                                     'manufacturer': 'manufacturer', 'model': 'model'}),
+    'employees': (EmployeeDoc, 'EMP', {'employee_code': 'code', 'name': 'name', 'role': 'role'}),
+    'customers': (CustomerDoc, 'CUST', {name: name for name in (
+        'customer_code', 'name', 'contact_person', 'phone', 'email', 'address', 'city', 'state', 'country',
+        'postal_code', 'is_active')}),
+    'vendors': (VendorDoc, 'VEND', {name: name for name in (
+        'vendor_code', 'name', 'contact_person', 'phone', 'email', 'address', 'city', 'state', 'country',
+        'postal_code', 'is_active')}),
+    'products': (ProductDoc, 'PROD', {name: name for name in (
+        'product_code', 'name', 'description', 'unit_of_measure', 'standard_price', 'product_type', 'is_active')}),
+    'tools': (ToolDoc, 'TOOL', {name: name for name in (
+        'tool_code', 'name', 'tool_type', 'specification', 'quantity_available', 'minimum_stock', 'unit_price',
+        'location', 'is_active')}),
+}
+
 # Helper function to generate unique codes
 def generate_unique_code(prefix, doc_class, field_name):
-    date_str = datetime.now().strftime('%Y%m%d')
-    counter = 1
-    while True:
-        code = f"{prefix}{date_str}{counter:04d}"
-        if not doc_class.objects(**{field_name: code}).first():
-            return code
-        counter += 1
+    return next_code(prefix, doc_class, field_name)
+
+def paginate_recent(queryset, per_page=10):
+    """Page a newest-first list: numbered pages when ?page= is given, otherwise
+    cursor navigation via ?after=/?before= so deep pages stay cheap."""
+    if 'page' in request.args:
+        return QuerySetPagination(queryset, request.args.get('page', 1, type=int), per_page)
+    return KeysetPagination(queryset, per_page,
+                            after=request.args.get('after'),
+                            before=request.args.get('before'))
+
+def request_payload():
+    """Body of an API request: its JSON, or its form fields when the body is
+    not JSON. Empty JSON stays empty instead of falling back to the form."""
+    data = request.get_json(force=True, silent=True)
+    return request.form if data is None else data
+
+def parse_date_arg(name):
+    """Parse a YYYY-MM-DD query argument, ignoring missing or malformed values"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+# Filtered list pages count at most this many matches and show "N+" beyond it
+LIST_COUNT_CAP = 10000
+
+def list_filters(date_field, *equality_fields):
+    """Translate a list page's GET filter form into QuerySet filters.
+
+    Returns (filter kwargs, the active query args to carry on pager links).
+    date_from/date_to bound date_field inclusively by day."""
+    filters, active = {}, {}
+    for name in equality_fields:
+        value = request.args.get(name)
+        if value:
+            filters[name] = value
+            active[name] = value
+    date_from = parse_date_arg('date_from')
+    if date_from:
+        filters[f'{date_field}__gte'] = date_from
+        active['date_from'] = request.args['date_from']
+    date_to = parse_date_arg('date_to')
+    if date_to:
+        filters[f'{date_field}__lt'] = date_to + timedelta(days=1)
+        active['date_to'] = request.args['date_to']
+    return filters, active
+
+# Rows saved this close to a refresh may not be visible to it yet, so each
+# refresh re-reads a short overlap window; the client replaces rows by id.
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+def refresh_marker():
+    """Timestamp a list page hands to its partial refreshes as the first ?since="""
+    return (datetime.utcnow() - REFRESH_OVERLAP).isoformat()
+
+def list_changes(doc_class, view, rows_template, prepare=None, limit=100):
+    """JSON delta of list rows updated after ?since=, each rendered as its <tr>.
+
+    Uses the updated_at index, so a kiosk refresh costs one small range
+    query. 'more' tells the client to reload when the delta was truncated."""
+    try:
+        since = datetime.fromisoformat(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({"error": "since must be an ISO timestamp"}), 400
+    if since.tzinfo is not None:
+        # Stored timestamps are naive UTC
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    marker = refresh_marker()
+    rows = list(doc_class.objects(updated_at__gt=since)
+                .only(*LIST_FIELDS[view], 'updated_at').order_by('updated_at').limit(limit))
+    if prepare:
+        prepare(rows)
+    return jsonify({
+        "since": marker,
+        "more": len(rows) == limit,
+        "rows": [{"id": str(row.id), "created": row.created_at > since,
+                  "html": render_template(rows_template, rows=[row])} for row in rows],
+    })
+
+def api_page(queryset, endpoint, max_limit=500, **endpoint_args):
+    """Apply optional ?limit=/?after=/?before= cursor paging to a JSON list API.
+
+    Returns (documents, Link header or None). Without paging parameters the
+    full list is returned as before."""
+    if not any(key in request.args for key in ('limit', 'after', 'before')):
+        return list(queryset.order_by('-created_at')), None
+    limit = min(max(request.args.get('limit', 100, type=int), 1), max_limit)
+    page = KeysetPagination(queryset, limit,
+                            after=request.args.get('after'),
+                            before=request.args.get('before'))
+    links = []
+    if page.next_cursor:
+        links.append(f'<{url_for(endpoint, after=page.next_cursor, limit=limit, **endpoint_args)}>; rel="next"')
+    if page.prev_cursor:
+        links.append(f'<{url_for(endpoint, before=page.prev_cursor, limit=limit, **endpoint_args)}>; rel="prev"')
+    return page.items, ", ".join(links) or None
+
+def wants_ndjson():
+    """True when a list API client asked for a stream (Accept: application/x-ndjson or ?stream=1)"""
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def list_api_response(doc_class, serializer, endpoint, **endpoint_args):
+    """Response for a JSON list API built from raw documents: a JSON array,
+    cursor-paged via api_page(), or in streaming mode one record per line
+    straight from the cursor."""
+    queryset = serializer.queryset(doc_class)
+    if wants_ndjson():
+        lines = ndjson_lines(queryset.order_by('-created_at'), serializer)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    documents, link = api_page(queryset, endpoint, **endpoint_args)
+    response = jsonify(serializer(documents))
+    if link:
+        response.headers["Link"] = link
+    return response
+
+def create_api_response(collection, on_created=None):
+    """Create one record (a JSON object) or many (a JSON array) for a create API.
+
+    Arrays are written with one unordered insert_many and answered with a
+    status per row, so a duplicate code only fails its own row. Missing
+    codes come from the process's code buffer, so steady API traffic rarely
+    touches the counters. on_created is called with every document that was
+    inserted."""
+    doc_class, prefix, fields = CREATE_FIELDS[collection]
+    data = request_payload()
+    if not data:
+        return jsonify({"ok": False, "error": "Empty request body"}), 400
+    rows = data if isinstance(data, list) else [data]
+    if len(rows) > BULK_CREATE_LIMIT:
+        return jsonify({"ok": False, "error": f"At most {BULK_CREATE_LIMIT} records per request"}), 413
+
+    errors = {}
+    documents = []  # (row index, document)
+    for index, row in enumerate(rows):
+        if not hasattr(row, 'get'):
+            errors[index] = "Expected an object"
+            continue
+        values = {field: row.get(key) for key, field in fields.items() if row.get(key) not in (None, '')}
+        documents.append((index, doc_class(**values)))
+
+    code_field = CODE_FIELDS[prefix][1]
+    missing_code = [doc for _, doc in documents if not getattr(doc, code_field)]
+    for doc, code in zip(missing_code, buffered_codes(prefix, len(missing_code)) if missing_code else ()):
+        setattr(doc, code_field, code)
+
+    created = []
+    for (index, doc), error in zip(documents, bulk_insert([doc for _, doc in documents])):
+        if error:
+            errors[index] = error
+        else:
+            created.append((index, doc))
+    if created and on_created:
+        on_created(*[doc for _, doc in created])
+
+    if not isinstance(data, list):
+        if errors:
+            return jsonify({"ok": False, "error": errors[0]}), 400
+        return jsonify({"ok": True, "id": str(created[0][1].id)}), 201
+
+    results = [{"index": index, "ok": False, "error": error} for index, error in errors.items()]
+    results += [{"index": index, "ok": True, "id": str(doc.id), code_field: getattr(doc, code_field)}
+                for index, doc in created]
+    results.sort(key=lambda result: result["index"])
+    return jsonify({"created": len(created), "failed": len(errors), "results": results}), 207 if errors else 201
 
 # ---------------- Home ----------------
 @main_bp.route("/")
@@ -81,37 +374,11 @@ def index():
 @login_required
 def dashboard():
     try:
-        # Calculate real statistics
-        total_work_orders = WorkOrderDoc.objects().count()
-        completed_work_orders = WorkOrderDoc.objects(status="Completed").count()
-        in_progress_work_orders = WorkOrderDoc.objects(status="In Progress").count()
-
-        total_inspections = InspectionDoc.objects().count()
-        passed_inspections = InspectionDoc.objects(status="Passed").count()
-        failed_inspections = InspectionDoc.objects(status="Failed").count()
-        pending_inspections = InspectionDoc.objects(status="Pending").count()
-
-        total_tools = ToolDoc.objects().count()
-        low_stock_tools = 0
-        if total_tools > 0:
-            for tool in ToolDoc.objects():
-                if tool.quantity_available <= tool.minimum_stock:
-                    low_stock_tools += 1
-
-        active_employees = EmployeeDoc.objects(is_active=True).count()
-        active_machines = MachineDoc.objects(is_active=True).count()
-        pending_pos = PurchaseOrderDoc.objects(status="Pending").count()
-
         context = {
-            "stats": {
-                "work_orders": total_work_orders,
-                "pending_inspections": pending_inspections,
-                "low_stock_tools": low_stock_tools,
-                "active_employees": active_employees,
-                "active_machines": active_machines,
-                "pending_pos": pending_pos,
-            },
-            "recent_work_orders": list(WorkOrderDoc.objects().order_by('-created_at')[:5]),
+            "stats": dashboard_stats(),
+            "recent_work_orders": prefetch_references(list(WorkOrderDoc.objects().order_by('-created_at')[:5]),
+                                                      item=('name',)),
+            "low_stock_items": low_stock_tools(limit=5),
         }
     except Exception:
         # Fallback with mock data if database is not properly set up
@@ -125,9 +392,18 @@ def dashboard():
                 "pending_pos": 0,
             },
             "recent_work_orders": [],
+            "low_stock_items": [],
         }
     return render_template('dashboard.html', **context)
 
+@main_bp.route('/dashboard/stream')
+@login_required
+def dashboard_stream():
+    # Server-Sent Events: stat deltas and new work orders from the shared per-process poller.
+    # The stream ends after live_feed.STREAM_MAX_SECONDS and the browser reconnects.
+    return Response(event_stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # =======================
 # API ROUTES (JSON)
 # =======================
@@ -136,54 +412,53 @@ def dashboard():
 @main_bp.route("/machines", methods=["GET"], endpoint="machines_list_api")
 @login_required
 def machines_list_api():
-    machines = list(MachineDoc.objects().order_by("-created_at"))
-    return jsonify([{
-        "id": str(m.id),
-        "machine_code": m.machine_code,
-        "name": m.name,
-        "machine_type": m.machine_type,
-        "manufacturer": m.manufacturer or "",
-        "model": m.model or "",
-    } for m in machines])
+    return list_api_response(MachineDoc, MACHINE_JSON, "main.machines_list_api")
 
 @main_bp.route("/machines", methods=["POST"], endpoint="machines_create_api")
 @login_required
 def machines_create_api():
-    data = request.get_json(force=True, silent=True) or request.form
-    doc = MachineDoc(
-        machine_code=data.get("machine_code"),
-        name=data.get("name"),
-        machine_type=data.get("machine_type"),
-        manufacturer=data.get("manufacturer"),
-        model=data.get("model"),
-    )
-    doc.save()
-    return jsonify({"ok": True, "id": str(doc.id)}), 201
+    return create_api_response('machines', on_created=record_created)
 
 # ---- Employees API ----
 @main_bp.route("/employees", methods=["GET"], endpoint="employees_list_api")
 @login_required
 def employees_list_api():
-    employees = list(EmployeeDoc.objects().order_by("-created_at"))
-    return jsonify([{
-        "id": str(e.id),
-        "employee_code": getattr(e, "code", None),
-        "name": getattr(e, "name", None),
-        "department": str(getattr(e, "department", None)) if getattr(e, "department", None) else None,
-        "role": getattr(e, "role", None)
-    } for e in employees])
+    return list_api_response(EmployeeDoc, EMPLOYEE_JSON, "main.employees_list_api")
 
 @main_bp.route("/employees", methods=["POST"], endpoint="employees_create_api")
 @login_required
 def employees_create_api():
-    data = request.get_json(force=True, silent=True) or request.form
-    doc = EmployeeDoc(
-        code=data.get("employee_code"),
-        name=data.get("name"),
-        role=data.get("role", "Operator")
-    )
-    doc.save()
-    return jsonify({"ok": True, "id": str(doc.id)}), 201
+    return create_api_response('employees', on_created=record_created)
+
+# ---- Master data create APIs ----
+@main_bp.route("/customers", methods=["POST"], endpoint="customers_create_api")
+@login_required
+def customers_create_api():
+    return create_api_response('customers')
+
+@main_bp.route("/vendors", methods=["POST"], endpoint="vendors_create_api")
+@login_required
+def vendors_create_api():
+    return create_api_response('vendors')
+
+@main_bp.route("/products", methods=["POST"], endpoint="products_create_api")
+@login_required
+def products_create_api():
+    return create_api_response('products')
+
+@main_bp.route("/tools", methods=["POST"], endpoint="tools_create_api")
+@login_required
+def tools_create_api():
+    return create_api_response('tools')
+
+# ---- Collection APIs ----
+@main_bp.route("/api/<collection>", methods=["GET"], endpoint="collection_list_api")
+@login_required
+def collection_list_api(collection):
+    if collection not in API_COLLECTIONS:
+        abort(404)
+    doc_class, serializer = API_SERIALIZERS[collection]
+    return list_api_response(doc_class, serializer, "main.collection_list_api", collection=collection)
 
 # =======================
 # CUSTOMERS
@@ -192,8 +467,8 @@ def employees_create_api():
 @login_required
 def customers_list():
     page = request.args.get('page', 1, type=int)
-    customers_list = list(CustomerDoc.objects().order_by('-created_at'))
-    customers = SimplePagination(customers_list, page, per_page=10)
+    query = CustomerDoc.objects().only(*LIST_FIELDS['customers_list']).order_by('-created_at')
+    customers = QuerySetPagination(query, page, per_page=10)
     return render_template('customers/list.html', customers=customers)
 
 @main_bp.route('/customers/new', methods=['GET', 'POST'])
@@ -253,8 +528,9 @@ def customers_edit(id):
 def employees_list():
     page = request.args.get('page', 1, type=int)
     per_page = 10
-    all_employees = list(EmployeeDoc.objects().order_by('-created_at'))
-    employees = SimplePagination(all_employees, page, per_page)
+    query = EmployeeDoc.objects().only(*LIST_FIELDS['employees_list']).order_by('-created_at')
+    employees = QuerySetPagination(query, page, per_page)
+    prefetch_references(employees.items, **LIST_REFERENCES['employees_list'])
     return render_template('employees/list.html', employees=employees)
 
 @main_bp.route('/employees_new', methods=['GET', 'POST'])
@@ -289,6 +565,7 @@ def employees_new():
                 is_active=form.is_active.data
             )
             employee.save()
+            record_created(employee)
             flash('Employee created successfully!', 'success')
             return redirect(url_for('main.employees_list'))
 
@@ -298,6 +575,7 @@ def employees_new():
 @login_required
 def employees_edit(id):
     employee = EmployeeDoc.objects.get_or_404(id=id)
+    was_active = employee.is_active
     form = EmployeeForm()
 
     # Populate department choices
@@ -328,6 +606,7 @@ def employees_edit(id):
             employee.role = form.designation.data
             employee.is_active = form.is_active.data
             employee.save()
+            record_changed(employee, was_active)
             flash('Employee updated successfully!', 'success')
             return redirect(url_for('main.employees_list'))
 
@@ -340,8 +619,8 @@ def employees_edit(id):
 @login_required
 def machines_list():
     page = request.args.get('page', 1, type=int)
-    machines_list = list(MachineDoc.objects().order_by('-created_at'))
-    machines = SimplePagination(machines_list, page, per_page=10)
+    query = MachineDoc.objects().only(*LIST_FIELDS['machines_list']).order_by('-created_at')
+    machines = QuerySetPagination(query, page, per_page=10)
     return render_template('machines/list.html', machines=machines)
 
 @main_bp.route('/machines_new', methods=['GET', 'POST'])
@@ -365,6 +644,7 @@ def machines_new():
             is_active=form.is_active.data
         )
         machine.save()
+        record_created(machine)
         flash('Machine created successfully!', 'success')
         return redirect(url_for('main.machines_list'))
     return render_template('machines/form.html', form=form, title="Add Machine")
@@ -373,6 +653,7 @@ def machines_new():
 @login_required
 def machines_edit(id):
     machine = MachineDoc.objects.get_or_404(id=id)
+    was_active = machine.is_active
     form = MachineForm(obj=machine)
     if form.validate_on_submit():
         machine.machine_code = form.machine_code.data
@@ -385,6 +666,7 @@ def machines_edit(id):
         machine.installation_date = form.installation_date.data
         machine.is_active = form.is_active.data
         machine.save()
+        record_changed(machine, was_active)
         flash('Machine updated successfully!', 'success')
         return redirect(url_for('main.machines_list'))
     return render_template('machines/form.html', form=form, title="Edit Machine")
@@ -396,9 +678,25 @@ def machines_edit(id):
 @login_required
 def tools_list():
     page = request.args.get('page', 1, type=int)
-    tools_list = list(ToolDoc.objects().order_by('-created_at'))
-    tools = SimplePagination(tools_list, page, per_page=10)
-    return render_template('tools/list.html', tools=tools)
+    filters, filter_args = {}, {}
+    if request.args.get('low_stock'):
+        filters['is_low_stock'] = True
+        filter_args['low_stock'] = 1
+    query = ToolDoc.objects(**filters).only(*LIST_FIELDS['tools_list']).order_by('-created_at')
+    tools = QuerySetPagination(query, page, per_page=10)
+    return render_template('tools/list.html', tools=tools, filter_args=filter_args)
+
+@main_bp.route('/tools/low_stock', methods=['GET'], endpoint='tools_low_stock_api')
+@login_required
+def tools_low_stock_api():
+    return jsonify([{
+        "id": str(t.id),
+        "tool_code": t.tool_code,
+        "name": t.name,
+        "quantity_available": t.quantity_available,
+        "minimum_stock": t.minimum_stock,
+        "location": t.location or "",
+    } for t in low_stock_tools()])
 
 @main_bp.route('/tools_new', methods=['GET', 'POST'])
 @login_required
@@ -436,12 +734,19 @@ def tools_edit(id):
         tool.name = form.name.data
         tool.tool_type = form.tool_type.data
         tool.specification = form.specification.data
-        tool.quantity_available = form.quantity_available.data
         tool.minimum_stock = form.minimum_stock.data
         tool.unit_price = form.unit_price.data
         tool.location = form.location.data
         tool.is_active = form.is_active.data
+        # Stock moves by the difference with one conditional update instead of
+        # saving the whole figure, so issues made meanwhile are not overwritten
+        delta = (form.quantity_available.data or 0) - (tool.quantity_available or 0)
         tool.save()
+        if delta and not adjust_stock(ToolDoc, tool.id, delta):
+            flash('Stock was issued meanwhile; the available quantity was not changed.', 'warning')
+            return redirect(url_for('main.tools_list'))
+        if not delta:
+            ToolDoc.refresh_low_stock(id=tool.id)  # save() derived it from the quantity as loaded
         flash('Tool updated successfully!', 'success')
         return redirect(url_for('main.tools_list'))
     return render_template('tools/form.html', form=form, title="Edit Tool")
@@ -453,8 +758,8 @@ def tools_edit(id):
 @login_required
 def vendors_list():
     page = request.args.get('page', 1, type=int)
-    vendors_list = list(VendorDoc.objects().order_by('-created_at'))
-    vendors = SimplePagination(vendors_list, page, per_page=10)
+    query = VendorDoc.objects().only(*LIST_FIELDS['vendors_list']).order_by('-created_at')
+    vendors = QuerySetPagination(query, page, per_page=10)
     return render_template('vendors/list.html', vendors=vendors)
 
 @main_bp.route('/vendors_new', methods=['GET', 'POST'])
@@ -513,14 +818,20 @@ def vendors_edit(id):
 @login_required
 def products_list():
     page = request.args.get('page', 1, type=int)
-    products_list = list(ProductDoc.objects().order_by('-created_at'))
-    products = SimplePagination(products_list, page, per_page=10)
+    query = ProductDoc.objects().only(*LIST_FIELDS['products_list']).order_by('-created_at')
+    products = QuerySetPagination(query, page, per_page=10)
     return render_template('products/list.html', products=products)
 
+def product_item_choices():
+    # The stocked item a product is made as; its BOM drives MRP
+    return [('', 'Not stocked')] + [
+        (str(i.id), f"{i.code} - {i.name}") for i in InventoryItemDoc.objects().only('code', 'name')]
+
 @main_bp.route('/products_new', methods=['GET', 'POST'])
 @login_required
 def products_new():
     form = ProductForm()
+    form.item_id.choices = product_item_choices()
     if request.method == 'GET':
         form.product_code.data = generate_unique_code("PROD", ProductDoc, "product_code")
         form.is_active.data = True
@@ -533,6 +844,7 @@ def products_new():
             unit_of_measure=form.unit_of_measure.data,
             standard_price=form.standard_price.data,
             product_type=form.product_type.data,
+            item=ObjectId(form.item_id.data) if form.item_id.data else None,
             is_active=form.is_active.data
         )
         product.save()
@@ -545,6 +857,9 @@ def products_new():
 def products_edit(id):
     product = ProductDoc.objects.get_or_404(id=id)
     form = ProductForm(obj=product)
+    form.item_id.choices = product_item_choices()
+    if request.method == 'GET' and product._data.get('item') is not None:
+        form.item_id.data = str(getattr(product._data['item'], 'id', product._data['item']))
     if form.validate_on_submit():
         product.product_code = form.product_code.data
         product.name = form.name.data
@@ -552,6 +867,7 @@ def products_edit(id):
         product.unit_of_measure = form.unit_of_measure.data
         product.standard_price = form.standard_price.data
         product.product_type = form.product_type.data
+        product.item = ObjectId(form.item_id.data) if form.item_id.data else None
         product.is_active = form.is_active.data
         product.save()
         flash('Product updated successfully!', 'success')
@@ -564,21 +880,17 @@ def products_edit(id):
 @main_bp.route('/work_orders_list')
 @login_required
 def work_orders_list():
-    page = request.args.get('page', 1, type=int)
-    work_orders_list = list(WorkOrderDoc.objects().order_by('-created_at'))
-    # Add missing attributes for templates
-    for wo in work_orders_list:
-        if not hasattr(wo, 'product') and hasattr(wo, 'item'):
-            wo.product = wo.item
-        if not hasattr(wo, 'quantity_ordered'):
-            wo.quantity_ordered = wo.quantity if hasattr(wo, 'quantity') else 0
-        if not hasattr(wo, 'quantity_produced'):
-            wo.quantity_produced = 0
-        if not hasattr(wo, 'priority'):
-            wo.priority = "Normal"
-
-    work_orders = SimplePagination(work_orders_list, page, per_page=10)
-    return render_template('production/work_orders.html', work_orders=work_orders)
+    query = WorkOrderDoc.objects().only(*LIST_FIELDS['work_orders_list']).order_by('-created_at')
+    work_orders = paginate_recent(query, per_page=10)
+    prefetch_references(work_orders.items, **LIST_REFERENCES['work_orders_list'])
+    return render_template('production/work_orders.html', work_orders=work_orders,
+                           refreshed_at=refresh_marker())
+
+@main_bp.route('/work_orders_list/changes')
+@login_required
+def work_orders_changes():
+    return list_changes(WorkOrderDoc, 'work_orders_list', 'production/_work_order_rows.html',
+                        prepare=lambda rows: prefetch_references(rows, **LIST_REFERENCES['work_orders_list']))
 
 @main_bp.route('/work_orders_new', methods=['GET', 'POST'])
 @login_required
@@ -602,9 +914,11 @@ def work_orders_new():
                 quantity=form.quantity_ordered.data,
                 start_date=form.planned_start_date.data,
                 due_date=form.planned_end_date.data,
+                priority=form.priority.data,
                 status=form.status.data
             )
             work_order.save()
+            record_created(work_order)
             flash('Work Order created successfully!', 'success')
             return redirect(url_for('main.work_orders_list'))
 
@@ -617,8 +931,9 @@ def work_orders_new():
 @login_required
 def inspections_list():
     page = request.args.get('page', 1, type=int)
-    inspections_list = list(InspectionDoc.objects().order_by('-created_at'))
-    inspections = SimplePagination(inspections_list, page, per_page=10)
+    query = InspectionDoc.objects().only(*LIST_FIELDS['inspections_list']).order_by('-created_at')
+    inspections = QuerySetPagination(query, page, per_page=10)
+    prefetch_references(inspections.items, **LIST_REFERENCES['inspections_list'])
     return render_template('quality/inspections.html', inspections=inspections)
 
 @main_bp.route('/inspections_new', methods=['GET', 'POST'])
@@ -648,6 +963,7 @@ def inspections_new():
             remarks=form.remarks.data
         )
         inspection.save()
+        record_created(inspection)
         flash('Inspection created successfully!', 'success')
         return redirect(url_for('main.inspections_list'))
     return render_template('quality/inspection_form.html', form=form, title="New Inspection")
@@ -659,17 +975,25 @@ def inspections_new():
 @login_required
 def purchase_orders_list():
     page = request.args.get('page', 1, type=int)
-    purchase_orders_list = list(PurchaseOrderDoc.objects().order_by('-created_at'))
+    filters, filter_args = list_filters('order_date', 'status')
+    vendor = request.args.get('vendor', '').strip()
+    if vendor:
+        filters['supplier_name__icontains'] = vendor
+        filter_args['vendor'] = vendor
+    # Filtered views sort on order_date so the (status, order_date, created_at) index serves both
+    ordering = ('-order_date', '-created_at') if filters else ('-created_at',)
+    query = PurchaseOrderDoc.objects(**filters).only(*LIST_FIELDS['purchase_orders_list']).order_by(*ordering)
+    purchase_orders = QuerySetPagination(query, page, per_page=10, count_cap=LIST_COUNT_CAP)
     # Add missing attributes for templates
-    for po in purchase_orders_list:
+    for po in purchase_orders.items:
         if not hasattr(po, 'created_by_user'):
             po.created_by_user = current_user
         if not hasattr(po, 'vendor') and hasattr(po, 'supplier_name'):
             # Create a mock vendor object
             po.vendor = type('MockVendor', (), {'name': po.supplier_name})()
 
-    purchase_orders = SimplePagination(purchase_orders_list, page, per_page=10)
-    return render_template('procurement/purchase_orders.html', purchase_orders=purchase_orders)
+    return render_template('procurement/purchase_orders.html', purchase_orders=purchase_orders,
+                           filter_args=filter_args)
 
 @main_bp.route('/purchase_orders_new', methods=['GET', 'POST'])
 @login_required
@@ -694,6 +1018,7 @@ def purchase_orders_new():
             created_by_user=current_user
         )
         purchase_order.save()
+        record_created(purchase_order)
         flash('Purchase Order created successfully!', 'success')
         return redirect(url_for('main.purchase_orders_list'))
     return render_template('procurement/purchase_order_form.html', form=form, title="New Purchase Order")
@@ -705,14 +1030,18 @@ def purchase_orders_new():
 @login_required
 def sales_orders_list():
     page = request.args.get('page', 1, type=int)
-    sales_orders_list = list(SalesOrderDoc.objects().order_by('-created_at'))
+    filters, filter_args = list_filters('order_date', 'status', 'priority')
+    # Filtered views sort on order_date so the (status, priority, order_date, created_at) index serves both
+    ordering = ('-order_date', '-created_at') if filters else ('-created_at',)
+    query = SalesOrderDoc.objects(**filters).only(*LIST_FIELDS['sales_orders_list']).order_by(*ordering)
+    sales_orders = QuerySetPagination(query, page, per_page=10, count_cap=LIST_COUNT_CAP)
+    prefetch_references(sales_orders.items, **LIST_REFERENCES['sales_orders_list'])
     # Ensure created_by_user is set
-    for so in sales_orders_list:
+    for so in sales_orders.items:
         if not hasattr(so, 'created_by_user') or not so.created_by_user:
             so.created_by_user = current_user
 
-    sales_orders = SimplePagination(sales_orders_list, page, per_page=10)
-    return render_template('sales/orders.html', sales_orders=sales_orders)
+    return render_template('sales/orders.html', sales_orders=sales_orders, filter_args=filter_args)
 
 @main_bp.route('/sales_orders_new', methods=['GET', 'POST'])
 @login_required
@@ -735,6 +1064,7 @@ def sales_orders_new():
             created_by_user=current_user
         )
         sales_order.save()
+        record_created(sales_order)
         flash('Sales Order created successfully!', 'success')
         return redirect(url_for('main.sales_orders_list'))
     return render_template('sales/order_form.html', form=form, title="New Sales Order")
@@ -745,9 +1075,9 @@ def sales_orders_new():
 @main_bp.route('/tool_issuances_list')
 @login_required
 def tool_issuances_list():
-    page = request.args.get('page', 1, type=int)
-    issuances_list = list(ToolIssuanceDoc.objects().order_by('-created_at'))
-    issuances = SimplePagination(issuances_list, page, per_page=10)
+    query = ToolIssuanceDoc.objects().only(*LIST_FIELDS['tool_issuances_list']).order_by('-created_at')
+    issuances = paginate_recent(query, per_page=10)
+    prefetch_references(issuances.items, **LIST_REFERENCES['tool_issuances_list'])
     return render_template('toolroom/issuance.html', issuances=issuances)
 
 @main_bp.route('/tool_issuances_new', methods=['GET', 'POST'])
@@ -762,40 +1092,62 @@ def tool_issuances_new():
         form.issue_number.data = generate_unique_code("TI", ToolIssuanceDoc, "issue_number")
 
     if form.validate_on_submit():
-        tool = ToolDoc.objects.get(id=form.tool_id.data)
-        if tool.quantity_available < form.quantity_issued.data:
-            flash('Insufficient quantity available!', 'error')
-            return render_template('toolroom/issuance_form.html', form=form, title="Issue Tool")
-
         issuance = ToolIssuanceDoc(
             issue_number=form.issue_number.data,
-            tool=tool,
+            tool=ObjectId(form.tool_id.data),
             employee=EmployeeDoc.objects.get(id=form.employee_id.data),
             work_order=WorkOrderDoc.objects.get(id=form.work_order_id.data) if form.work_order_id.data else None,
             quantity_issued=form.quantity_issued.data,
             issue_date=form.issue_date.data,
             expected_return_date=form.expected_return_date.data
         )
-        issuance.save()
-
-        # Update tool quantity
-        tool.quantity_available -= form.quantity_issued.data
-        tool.save()
+        # One conditional $inc takes the stock, so concurrent issues cannot oversubscribe
+        try:
+            issue_tool(issuance)
+        except InsufficientStock:
+            flash('Insufficient quantity available!', 'error')
+            return render_template('toolroom/issuance_form.html', form=form, title="Issue Tool")
 
         flash('Tool issued successfully!', 'success')
         return redirect(url_for('main.tool_issuances_list'))
     return render_template('toolroom/issuance_form.html', form=form, title="Issue Tool")
 
+@main_bp.route('/tool_issuances/<id>/return', methods=['POST'], endpoint='tool_issuances_return')
+@login_required
+def tool_issuances_return(id):
+    if current_user.role not in ['Admin', 'Manager', 'Storekeeper']:
+        return jsonify({"ok": False, "error": "Not allowed to return tools"}), 403
+    data = request_payload()
+    if not data or not hasattr(data, 'get'):
+        return jsonify({"ok": False, "error": "Expected a non-empty object"}), 400
+    try:
+        quantity = int(data.get('quantity') or 0)
+        returned_at = datetime.strptime(data['return_date'], '%Y-%m-%d') if data.get('return_date') else None
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid quantity or return date"}), 400
+    if not ObjectId.is_valid(id) or quantity < 1:
+        return jsonify({"ok": False, "error": "Invalid issuance or quantity"}), 400
+    if not return_tool(ObjectId(id), quantity, returned_at):
+        return jsonify({"ok": False, "error": "Return exceeds the quantity still issued"}), 409
+    return jsonify({"ok": True})
+
 # =======================
 # JOB CARDS
 # =======================
 @main_bp.route('/job_cards_list')
 @login_required
 def job_cards_list():
-    page = request.args.get('page', 1, type=int)
-    job_cards_list = list(JobCardDoc.objects().order_by('-created_at'))
-    job_cards = SimplePagination(job_cards_list, page, per_page=10)
-    return render_template('production/job_cards.html', job_cards=job_cards)
+    query = JobCardDoc.objects().only(*LIST_FIELDS['job_cards_list']).order_by('-created_at')
+    job_cards = paginate_recent(query, per_page=10)
+    prefetch_references(job_cards.items, **LIST_REFERENCES['job_cards_list'])
+    return render_template('production/job_cards.html', job_cards=job_cards,
+                           refreshed_at=refresh_marker())
+
+@main_bp.route('/job_cards_list/changes')
+@login_required
+def job_cards_changes():
+    return list_changes(JobCardDoc, 'job_cards_list', 'production/_job_card_rows.html',
+                        prepare=lambda rows: prefetch_references(rows, **LIST_REFERENCES['job_cards_list']))
 
 # =======================
 # INVENTORY
@@ -804,11 +1156,16 @@ def job_cards_list():
 @login_required
 def inventory_raw_materials():
     page = request.args.get('page', 1, type=int)
-    raw_materials_list = list(InventoryItemDoc.objects().order_by('-created_at'))
+    query = InventoryItemDoc.objects().only(*LIST_FIELDS['inventory_raw_materials']).order_by('-created_at')
+    raw_materials = QuerySetPagination(query, page, per_page=10)
+    # Stock comes from the inventory ledger, optionally as of the end of ?as_of=
+    as_of_day = parse_date_arg('as_of')
+    filter_args = {'as_of': request.args['as_of']} if as_of_day else {}
+    levels = stock_levels([item.id for item in raw_materials.items],
+                          as_of_day + timedelta(days=1) if as_of_day else None)
     # Add missing attributes for templates
-    for item in raw_materials_list:
-        if not hasattr(item, 'current_stock'):
-            item.current_stock = item.quantity if hasattr(item, 'quantity') else 0
+    for item in raw_materials.items:
+        item.current_stock = levels[item.id]
         if not hasattr(item, 'minimum_stock'):
             item.minimum_stock = 5  # Default minimum stock
         if not hasattr(item, 'material_code'):
@@ -821,15 +1178,98 @@ def inventory_raw_materials():
             item.location = "Store"
         if not hasattr(item, 'is_active'):
             item.is_active = True
+        item.is_low_stock = item.current_stock <= item.minimum_stock
 
-    raw_materials = SimplePagination(raw_materials_list, page, per_page=10)
-    return render_template('inventory/raw_materials.html', raw_materials=raw_materials)
+    return render_template('inventory/raw_materials.html', raw_materials=raw_materials,
+                           filter_args=filter_args, as_of=as_of_day)
+
+@main_bp.route('/inventory/<id>/adjust', methods=['POST'], endpoint='inventory_adjust_api')
+@login_required
+def inventory_adjust_api(id):
+    if current_user.role not in ['Admin', 'Manager', 'Storekeeper']:
+        return jsonify({"ok": False, "error": "Not allowed to adjust stock"}), 403
+    data = request_payload()
+    if not data or not hasattr(data, 'get'):
+        return jsonify({"ok": False, "error": "Expected a non-empty object"}), 400
+    try:
+        delta = float(data.get('quantity'))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "quantity must be a number"}), 400
+    if not ObjectId.is_valid(id) or not delta or not InventoryItemDoc.objects(id=id).count():
+        return jsonify({"ok": False, "error": "Invalid item or quantity"}), 400
+    try:
+        adjust_inventory(ObjectId(id), delta, data.get('reason'), current_user)
+    except InsufficientStock:
+        return jsonify({"ok": False, "error": "Adjustment would take stock below zero"}), 409
+    return jsonify({"ok": True})
+
+@main_bp.route('/material_issues', methods=['POST'], endpoint='material_issues_create_api')
+@login_required
+def material_issues_create_api():
+    # Stock is taken with one conditional update and the issue is posted to the ledger
+    if current_user.role not in ['Admin', 'Manager', 'Storekeeper']:
+        return jsonify({"ok": False, "error": "Not allowed to issue material"}), 403
+    data = request_payload()
+    if not data or not hasattr(data, 'get'):
+        return jsonify({"ok": False, "error": "Expected a non-empty object"}), 400
+    try:
+        quantity = float(data.get('quantity'))
+        issue_date = datetime.strptime(data['date'], '%Y-%m-%d') if data.get('date') else datetime.utcnow()
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid quantity or date"}), 400
+    refs = {}
+    for field, doc_class in (('item', InventoryItemDoc), ('work_order', WorkOrderDoc), ('issued_to', EmployeeDoc)):
+        value = data.get(field)
+        if not value and field != 'item':
+            continue
+        if not ObjectId.is_valid(value) or not doc_class.objects(id=value).count():
+            return jsonify({"ok": False, "error": f"Unknown {field}"}), 400
+        refs[field] = ObjectId(value)
+    if quantity <= 0:
+        return jsonify({"ok": False, "error": "quantity must be positive"}), 400
+    try:
+        material_issue = issue_material(MaterialIssueDoc(quantity=quantity, date=issue_date, **refs), current_user)
+    except InsufficientStock:
+        return jsonify({"ok": False, "error": "Not enough stock to issue"}), 409
+    return jsonify({"ok": True, "id": str(material_issue.id)}), 201
+
+@main_bp.route('/inventory/<id>/bom', methods=['PUT'], endpoint='inventory_bom_api')
+@login_required
+def inventory_bom_api(id):
+    if current_user.role not in ['Admin', 'Manager']:
+        return jsonify({"ok": False, "error": "Not allowed to edit BOMs"}), 403
+    if not ObjectId.is_valid(id) or not InventoryItemDoc.objects(id=id).count():
+        return jsonify({"ok": False, "error": "Item not found"}), 404
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, list):
+        return jsonify({"ok": False, "error": "Expected an array of BOM lines"}), 400
+    lines = []
+    for row in data:
+        try:
+            line = {"item": ObjectId(row['item']), "quantity": float(row['quantity']),
+                    "scrap_rate": float(row.get('scrap_rate') or 0)}
+        except Exception:
+            return jsonify({"ok": False, "error": "Each line needs an item id and a numeric quantity"}), 400
+        if line['quantity'] <= 0 or not 0 <= line['scrap_rate'] < 1:
+            return jsonify({"ok": False, "error": "quantity must be positive and scrap_rate in [0, 1)"}), 400
+        lines.append(line)
+    components = {line['item'] for line in lines}
+    if InventoryItemDoc.objects(id__in=list(components)).count() != len(components):
+        return jsonify({"ok": False, "error": "Unknown component item"}), 400
+    try:
+        check_bom(ObjectId(id), [(line['item'], line['quantity']) for line in lines])
+    except BOMCycleError as e:
+        return jsonify({"ok": False, "error": str(e)}), 409
+    InventoryItemDoc._get_collection().update_one({"_id": ObjectId(id)}, {"$set": {"bom": lines}})
+    return jsonify({"ok": True, "lines": len(lines)})
 
 @main_bp.route('/grn_new', methods=['GET', 'POST'])
 @login_required
 def grn_new():
     form = GRNForm()
     form.vendor_id.choices = [(str(v.id), v.name) for v in VendorDoc.objects()]
+    form.item_id.choices = [('', 'Select Material')] + [
+        (str(i.id), f"{i.code} - {i.name}") for i in InventoryItemDoc.objects().only('code', 'name')]
 
     if request.method == 'GET':
         form.grn_number.data = generate_unique_code("GRN", GRNDoc, "grn_number")
@@ -838,16 +1278,74 @@ def grn_new():
         grn = GRNDoc(
             grn_number=form.grn_number.data,
             vendor=VendorDoc.objects.get(id=form.vendor_id.data),
+            item=ObjectId(form.item_id.data) if form.item_id.data else None,
+            quantity=float(form.quantity.data) if form.quantity.data else None,
             received_date=form.received_date.data,
             invoice_number=form.invoice_number.data,
             total_amount=form.total_amount.data,
             status=form.status.data
         )
         grn.save()
+        if grn.quantity and form.item_id.data and grn.status != 'Rejected':
+            receive_stock(ObjectId(form.item_id.data), grn.quantity, reference=grn.grn_number,
+                          document_date=grn.received_date, user=current_user)
         flash('GRN created successfully!', 'success')
         return redirect(url_for('main.inventory_raw_materials'))
     return render_template('inventory/grn_form.html', form=form, title="New GRN")
 
+# =======================
+# PRODUCTION ENTRIES
+# =======================
+INGEST_BATCH_LIMIT = 5000
+
+@main_bp.route('/production_entries/ingest', methods=['POST'], endpoint='production_entries_ingest_api')
+@login_required
+def production_entries_ingest_api():
+    # Entries are queued and written in batches by ingest.py, usually within a second
+    data = request.get_json(force=True, silent=True)
+    if data is None:
+        return jsonify({"error": "Expected a JSON object or array"}), 400
+    rows = data if isinstance(data, list) else [data]
+    if len(rows) > INGEST_BATCH_LIMIT:
+        return jsonify({"error": f"At most {INGEST_BATCH_LIMIT} entries per request"}), 413
+    try:
+        accepted, errors = ingest_entries(rows)
+    except BufferFull:
+        response = jsonify({"error": "Ingestion buffer is full, retry shortly"})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    return jsonify({
+        "accepted": accepted,
+        "rejected": len(errors),
+        "errors": [{"index": index, "error": error} for index, error in sorted(errors.items())],
+    }), 202
+
+# =======================
+# PLANNING
+# =======================
+@main_bp.route('/planning/mrp', endpoint='mrp_requirements_api')
+@login_required
+def mrp_requirements_api():
+    # Net material requirements of all open work orders, exploded through the BOMs
+    try:
+        rows = explode_requirements()
+    except BOMCycleError as e:
+        return jsonify({"error": str(e), "items": [str(item) for item in e.items]}), 409
+    if request.args.get('action') in ('make', 'buy'):
+        rows = [row for row in rows if row['action'] == request.args['action']]
+    return jsonify({"generated_at": datetime.utcnow().isoformat(), "rows": rows})
+
+@main_bp.route('/planning/schedule', methods=['POST'], endpoint='job_card_schedule_api')
+@login_required
+def job_card_schedule_api():
+    # Re-plan every open job card on the active machines (see scheduler.py)
+    if current_user.role not in ['Admin', 'Manager']:
+        return jsonify({"ok": False, "error": "Not allowed to re-plan job cards"}), 403
+    summary = plan_job_cards()
+    summary['start'] = summary['start'].isoformat()
+    summary['finish'] = summary['finish'].isoformat() if summary['finish'] else None
+    return jsonify({"ok": True, **summary})
+
 # =======================
 # REPORTS
 # =======================
@@ -855,51 +1353,12 @@ def grn_new():
 @login_required
 def reports_dashboard():
     try:
-        # Calculate statistics for the dashboard
-        total_work_orders = WorkOrderDoc.objects().count()
-        completed_work_orders = WorkOrderDoc.objects(status="Completed").count()
-        in_progress_work_orders = WorkOrderDoc.objects(status="In Progress").count()
-
-        total_inspections = InspectionDoc.objects().count()
-        passed_inspections = InspectionDoc.objects(status="Passed").count()
-        failed_inspections = InspectionDoc.objects(status="Failed").count()
-
-        total_tools = ToolDoc.objects().count()
-        low_stock_tools = 0
-        if total_tools > 0:
-            for tool in ToolDoc.objects():
-                if tool.quantity_available <= tool.minimum_stock:
-                    low_stock_tools += 1
-
-        pending_pos = PurchaseOrderDoc.objects(status="Pending").count()
-
-        stats = {
-            "production": {
-                "completion_rate": round((completed_work_orders / total_work_orders * 100) if total_work_orders > 0 else 0, 1),
-                "completed_work_orders": completed_work_orders,
-                "total_work_orders": total_work_orders,
-                "in_progress_work_orders": in_progress_work_orders
-            },
-            "quality": {
-                "pass_rate": round((passed_inspections / total_inspections * 100) if total_inspections > 0 else 0, 1),
-                "passed_inspections": passed_inspections,
-                "failed_inspections": failed_inspections,
-                "total_inspections": total_inspections
-            },
-            "inventory": {
-                "stock_health": round(((total_tools - low_stock_tools) / total_tools * 100) if total_tools > 0 else 0, 1),
-                "low_stock_tools": low_stock_tools,
-                "total_tools": total_tools
-            },
-            "procurement": {
-                "fulfillment_rate": 85,  # Mock data
-                "pending_pos": pending_pos
-            }
-        }
+        stats = reports_stats()
     except Exception:
         # Fallback stats if database queries fail
         stats = {
-            "production": {"completion_rate": 0, "completed_work_orders": 0, "total_work_orders": 0, "in_progress_work_orders": 0},
+            "production": {"completion_rate": 0, "completed_work_orders": 0, "total_work_orders": 0, "in_progress_work_orders": 0,
+                           "output_rate": 0, "quantity_produced": 0, "quantity_ordered": 0},
             "quality": {"pass_rate": 0, "passed_inspections": 0, "failed_inspections": 0, "total_inspections": 0},
             "inventory": {"stock_health": 0, "low_stock_tools": 0, "total_tools": 0},
             "procurement": {"fulfillment_rate": 0, "pending_pos": 0}
@@ -907,6 +1366,93 @@ def reports_dashboard():
 
     return render_template('reports/dashboard.html', stats=stats)
 
+@main_bp.route('/reports/production', methods=['GET'], endpoint='reports_production_api')
+@login_required
+def reports_production_api():
+    # Served from the hourly/daily rollups as they stand; a stale watermark
+    # only kicks off a background run, so the newest entries may lag a little
+    date_to = parse_date_arg('date_to') or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    date_from = parse_date_arg('date_from') or date_to - timedelta(days=30)
+    group_by = request.args.get('group_by') or None
+    granularity = request.args.get('granularity', 'day')
+    if group_by not in (None,) + GROUP_FIELDS or granularity not in GRANULARITIES:
+        return jsonify({"error": "Unsupported group_by or granularity"}), 400
+
+    refresh_if_stale()
+    rows = production_summary(date_from, date_to + timedelta(days=1), group_by, granularity)
+    for row in rows:
+        row["bucket"] = row["bucket"].isoformat()
+    return jsonify(rows)
+
+def export_args():
+    """(report, format, date_from, date_to) from the Export modal's query args; raises ValueError"""
+    report = request.args.get('report')
+    fmt = request.args.get('format', 'csv')
+    date_range = request.args.get('range', 'month')
+    if report not in REPORTS or fmt not in FORMATS or date_range not in DATE_RANGES:
+        raise ValueError("Unsupported report, format or date range")
+    date_from, date_to = resolve_date_range(date_range, parse_date_arg('start'), parse_date_arg('end'))
+    return report, fmt, date_from, date_to
+
+@main_bp.route('/reports/export', methods=['GET'])
+@login_required
+def reports_export():
+    # Streamed straight from the cursor as the file is written
+    try:
+        report, fmt, date_from, date_to = export_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    chunks = export_chunks(report, fmt, iter_rows(report, date_from, date_to))
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt][0])
+    response.headers['Content-Disposition'] = \
+        f'attachment; filename="{export_filename(report, fmt, date_from, date_to)}"'
+    return response
+
+def export_job_json(job):
+    data = {
+        "id": str(job.id),
+        "report": job.report,
+        "format": job.format,
+        "status": job.status,
+        "rows": job.rows,
+        "status_url": url_for('main.reports_export_job', id=job.id),
+    }
+    if job.status == 'Completed':
+        data["download_url"] = url_for('main.reports_export_download', id=job.id)
+    if job.error:
+        data["error"] = job.error
+    return data
+
+def get_export_job(id):
+    job = ExportJobDoc.objects(id=id).first() if ObjectId.is_valid(id) else None
+    if not job or (job.created_by and job.created_by.id != current_user.id and current_user.role != 'Admin'):
+        abort(404)
+    return job
+
+@main_bp.route('/reports/export/jobs', methods=['POST'])
+@login_required
+def reports_export_jobs_create():
+    try:
+        report, fmt, date_from, date_to = export_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    job = start_export_job(report, fmt, date_from, date_to, current_user)
+    return jsonify(export_job_json(job)), 202
+
+@main_bp.route('/reports/export/jobs/<id>', methods=['GET'])
+@login_required
+def reports_export_job(id):
+    return jsonify(export_job_json(get_export_job(id)))
+
+@main_bp.route('/reports/export/jobs/<id>/download', methods=['GET'])
+@login_required
+def reports_export_download(id):
+    job = get_export_job(id)
+    if job.status != 'Completed':
+        abort(404)
+    return send_file(export_path(job), mimetype=FORMATS[job.format][0],
+                     as_attachment=True, download_name=job.file_name)
+
 # =======================
 # DEPARTMENTS
 # =======================
@@ -914,9 +1460,8 @@ def reports_dashboard():
 @login_required
 def departments_list():
     page = request.args.get('page', 1, type=int)
-    departments_list = list(DepartmentDoc.objects().order_by('-created_at'))
-
-    departments = SimplePagination(departments_list, page, per_page=10)
+    query = DepartmentDoc.objects().only(*LIST_FIELDS['departments_list']).order_by('-created_at')
+    departments = QuerySetPagination(query, page, per_page=10)
     return render_template('department/list.html', departments=departments)
 
 @main_bp.route('/departments_new', methods=['GET', 'POST'])
@@ -0,0 +1,155 @@
+"""Finite-capacity scheduling of open job cards on active machines.
+
+plan_job_cards() re-plans every open job card in one pass. Job cards are
+dispatched in order of work order priority, then due date, then creation;
+each one starts when both its machine and the work order's previous job
+card are done, since a machine runs one job card at a time. Started job
+cards are placed first, at the plan start on their own machine. Job cards
+already on an active machine stay there. The rest go to whichever machine
+of the type they need (machine_type, else their current machine's type)
+frees up first, found with one heap of machine free times per type, so a
+plan costs O(n log m) for n job cards on m machines. Started job cards are
+never moved: if their machine is inactive they are left unplanned, as are
+cards with no known machine type or no active machine of it. Machines are
+assumed to run continuously from the plan start.
+
+Only planned_start, planned_end, sequence (position in the machine's queue)
+and, for job cards given a machine, machine are written back, and only for
+job cards whose plan changed.
+"""
+import heapq
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from models_mongo import JobCardDoc, MachineDoc, WorkOrderDoc
+
+CLOSED_JOB_CARD_STATUSES = ("Completed", "Cancelled")
+STARTED_JOB_CARD_STATUSES = ("In Progress",)
+PRIORITY_RANK = {"Urgent": 0, "High": 1, "Normal": 2, "Low": 3}
+DEFAULT_HOURS = 1.0  # planned duration of a job card without a standard_time
+NO_DUE_DATE = datetime.max
+
+
+def schedule(jobs, machines, start):
+    """Plan jobs on machines from start.
+
+    jobs: dicts with id, machine (id or None), machine_type, started,
+    work_order, hours, priority, due_date and created_at. machines: active
+    machine id -> machine type. Returns job id -> (machine, planned_start,
+    planned_end, sequence) for the jobs that could be placed."""
+    free_at = dict.fromkeys(machines, start)
+    queued = dict.fromkeys(machines, 0)
+    heaps = {}  # machine type -> [(free at, machine)], may hold stale entries; see earliest()
+    for machine, machine_type in machines.items():
+        heaps.setdefault(machine_type, []).append((start, machine))
+    for heap in heaps.values():
+        heapq.heapify(heap)
+    work_order_ready = {}
+
+    def earliest(heap):
+        while True:
+            time, machine = heap[0]
+            if time == free_at[machine]:
+                return machine
+            heapq.heappop(heap)
+
+    def dispatch_order(job):
+        return (PRIORITY_RANK.get(job["priority"], PRIORITY_RANK["Normal"]),
+                job["due_date"] or NO_DUE_DATE, job["created_at"] or start)
+
+    # Started cards are already running: they hold their machine from start,
+    # ahead of anything waiting, whatever its priority
+    started = sorted((job for job in jobs if job["started"]), key=dispatch_order)
+    waiting = sorted((job for job in jobs if not job["started"]), key=dispatch_order)
+    plan = {}
+    for job in started + waiting:
+        if job["machine"] in machines:
+            machine = job["machine"]
+        elif job["started"] or job["machine_type"] not in heaps:
+            continue
+        else:
+            machine = earliest(heaps[job["machine_type"]])
+        if job["started"]:
+            begin = free_at[machine]
+        else:
+            begin = max(free_at[machine], work_order_ready.get(job["work_order"], start))
+        end = begin + timedelta(seconds=round(job["hours"] * 3600))  # whole seconds survive a round trip
+        plan[job["id"]] = (machine, begin, end, queued[machine])
+        queued[machine] += 1
+        free_at[machine] = end
+        heapq.heappush(heaps[machines[machine]], (end, machine))
+        if job["work_order"] is not None:
+            work_order_ready[job["work_order"]] = end
+    return plan
+
+
+def load_jobs():
+    """Open job cards as schedule() input, plus their current plan fields by id"""
+    cards = list(JobCardDoc._get_collection().find(
+        {"status": {"$nin": list(CLOSED_JOB_CARD_STATUSES)}},
+        {"machine": 1, "machine_type": 1, "work_order": 1, "standard_time": 1, "actual_time": 1, "status": 1,
+         "created_at": 1, "planned_start": 1, "planned_end": 1, "sequence": 1}))
+    machine_types = {row["_id"]: row.get("machine_type") for row in MachineDoc._get_collection().find(
+        {"_id": {"$in": list({card["machine"] for card in cards if card.get("machine")})}}, {"machine_type": 1})}
+    work_orders = {row["_id"]: row for row in WorkOrderDoc._get_collection().find(
+        {"_id": {"$in": list({card["work_order"] for card in cards if card.get("work_order")})}},
+        {"priority": 1, "due_date": 1})}
+
+    jobs = []
+    for card in cards:
+        work_order = work_orders.get(card.get("work_order"), {})
+        started = card.get("status") in STARTED_JOB_CARD_STATUSES or bool(card.get("actual_time"))
+        hours = card.get("standard_time") or DEFAULT_HOURS
+        if started:
+            hours = max(hours - (card.get("actual_time") or 0), 0)
+        jobs.append({
+            "id": card["_id"],
+            "machine": card.get("machine"),
+            "machine_type": card.get("machine_type") or machine_types.get(card.get("machine")),
+            "started": started,
+            "work_order": card.get("work_order"),
+            "hours": hours,
+            "priority": work_order.get("priority"),
+            "due_date": work_order.get("due_date"),
+            "created_at": card.get("created_at"),
+        })
+    return jobs, {card["_id"]: card for card in cards}
+
+
+def plan_job_cards(start=None):
+    """Re-plan all open job cards from start (now by default); returns a summary"""
+    start = (start or datetime.utcnow()).replace(microsecond=0)
+    machines = {row["_id"]: row.get("machine_type") for row in
+                MachineDoc._get_collection().find({"is_active": {"$ne": False}}, {"machine_type": 1})}
+    jobs, cards = load_jobs()
+    plan = schedule(jobs, machines, start)
+
+    now = datetime.utcnow()
+    updates = []
+    for job_id, (machine, begin, end, sequence) in plan.items():
+        card = cards[job_id]
+        if (card.get("machine"), card.get("planned_start"), card.get("planned_end"), card.get("sequence")) == \
+                (machine, begin, end, sequence):
+            continue
+        changes = {"planned_start": begin, "planned_end": end, "sequence": sequence, "updated_at": now}
+        if card.get("machine") != machine:
+            changes["machine"] = machine  # only unstarted cards without an active machine get here
+        updates.append(UpdateOne({"_id": job_id}, {"$set": changes}))
+    for job_id, card in cards.items():
+        if job_id not in plan and card.get("planned_start") is not None:
+            # No longer placeable, e.g. its machine was deactivated: drop the stale plan
+            updates.append(UpdateOne({"_id": job_id}, {
+                "$unset": {"planned_start": "", "planned_end": "", "sequence": ""}, "$set": {"updated_at": now}}))
+    if updates:
+        JobCardDoc._get_collection().bulk_write(updates, ordered=False)
+
+    due = {job["id"]: job["due_date"] for job in jobs}
+    return {
+        "planned": len(plan),
+        "unplanned": len(jobs) - len(plan),
+        "updated": len(updates),
+        "late": sum(1 for job_id, (_, _, end, _) in plan.items() if due[job_id] and end > due[job_id]),
+        "start": start,
+        "finish": max((end for _, _, end, _ in plan.values()), default=None),
+    }
@@ -0,0 +1,50 @@
+import argparse
+import os
+import random
+import time
+from mongoengine import connect, disconnect
+from mrp import explode, explode_requirements, low_level_codes
+
+
+
+def synthetic_boms(levels, width, fan_out):
+    """width items per level, each made of fan_out random items of the next level"""
+    return {(level, i): [((level + 1, random.randrange(width)), random.uniform(0.5, 3)) for _ in range(fan_out)]
+            for level in range(levels) for i in range(width)}
+
+
+def benchmark_mrp(orders, levels, width, fan_out, live=False):
+    random.seed(1)
+    boms = synthetic_boms(levels, width, fan_out)
+    demand = {}
+    for _ in range(orders):
+        item = (0, random.randrange(width))
+        demand[item] = demand.get(item, 0) + random.randint(1, 100)
+    available = {(level, i): random.randint(0, 500) for level in range(levels + 1) for i in range(width)}
+
+    start = time.perf_counter()
+    requirements = explode(demand, boms, available, low_level_codes(boms))
+    elapsed = time.perf_counter() - start
+    print(f"- {orders} orders, {levels} BOM levels x {width} items x {fan_out} components: "
+          f"{len(requirements)} items netted in {elapsed:.3f}s")
+
+    if live:
+        connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+        print("Connected to MongoDB.")
+        start = time.perf_counter()
+        rows = explode_requirements()
+        print(f"- Open work orders in mes_db: {len(rows)} requirement rows in {time.perf_counter() - start:.3f}s")
+        disconnect()
+        print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the MRP explosion on a synthetic BOM")
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--levels", type=int, default=8)
+    parser.add_argument("--width", type=int, default=2000, help="items per BOM level")
+    parser.add_argument("--fan-out", type=int, default=4, help="components per item")
+    parser.add_argument("--live", action="store_true", help="also time explode_requirements() against mes_db")
+    args = parser.parse_args()
+    benchmark_mrp(args.orders, args.levels, args.width, args.fan_out, args.live)
@@ -0,0 +1,68 @@
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from mongoengine import connect, disconnect
+from models_mongo import JobCardDoc, MachineDoc, WorkOrderDoc
+from scheduler import PRIORITY_RANK, load_jobs, plan_job_cards, schedule
+
+MACHINE_TYPES = ("CNC", "Lathe", "Milling", "Grinding", "Drilling")
+
+
+
+def seed(job_cards, machines, work_orders):
+    """Fill the benchmark database with machines, work orders and their open job cards"""
+    for doc_class in (JobCardDoc, MachineDoc, WorkOrderDoc):
+        doc_class.drop_collection()
+    now = datetime.utcnow()
+    machine_ids = [m.id for m in MachineDoc.objects.insert([
+        MachineDoc(machine_code=f"MCH{i:05d}", name=f"Machine {i}",
+                   machine_type=MACHINE_TYPES[i % len(MACHINE_TYPES)]) for i in range(machines)])]
+    work_order_ids = [w.id for w in WorkOrderDoc.objects.insert([
+        WorkOrderDoc(work_order_number=f"WO{i:06d}", quantity=random.randint(10, 500),
+                     due_date=now + timedelta(days=random.randint(1, 30)),
+                     priority=random.choice(list(PRIORITY_RANK))) for i in range(work_orders)])]
+    JobCardDoc.objects.insert([
+        JobCardDoc(job_card_number=f"JC{i:07d}", work_order=random.choice(work_order_ids),
+                   machine=random.choice(machine_ids) if random.random() < 0.5 else None,
+                   machine_type=random.choice(MACHINE_TYPES),
+                   operation_description="Synthetic operation", standard_time=round(random.uniform(0.5, 8), 2),
+                   status=random.choice(["Assigned", "Assigned", "In Progress"]))
+        for i in range(job_cards)], load_bulk=False)
+
+
+def timed(label, run):
+    start = time.perf_counter()
+    result = run()
+    print(f"  {label:<28} {time.perf_counter() - start:7.3f}s")
+    return result
+
+
+def benchmark_scheduler(job_cards, machines, work_orders):
+    random.seed(1)
+    connect('mes_bench', host=os.getenv('MONGO_BENCH_URI', 'mongodb://localhost:27017/mes_bench'))
+    print(f"Connected to MongoDB benchmark database; seeding {job_cards} job cards on {machines} machines.")
+    seed(job_cards, machines, work_orders)
+
+    jobs, _ = timed("load open job cards", load_jobs)
+    machines = {m.id: m.machine_type for m in MachineDoc.objects.only("machine_type")}
+    timed("schedule() in memory", lambda: schedule(jobs, machines, datetime.utcnow()))
+    start = datetime.utcnow()
+    summary = timed("plan_job_cards(), first plan", lambda: plan_job_cards(start))
+    print(f"  {summary['planned']} planned, {summary['late']} late, {summary['updated']} written")
+    summary = timed("plan_job_cards(), unchanged", lambda: plan_job_cards(start))
+    print(f"  {summary['updated']} written")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time job card re-planning on a synthetic load")
+    parser.add_argument("--job-cards", type=int, default=5000)
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--work-orders", type=int, default=1500)
+    args = parser.parse_args()
+    benchmark_scheduler(args.job_cards, args.machines, args.work_orders)
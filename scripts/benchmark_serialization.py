@@ -0,0 +1,85 @@
+import argparse
+import os
+import time
+from mongoengine import connect, disconnect
+from models_mongo import DepartmentDoc, EmployeeDoc, MachineDoc
+from routes_final import EMPLOYEE_JSON, MACHINE_JSON
+
+
+
+# The list API serializers as they were before the raw fast path: a hydrated
+# Document per row, with department dereferenced through attribute access
+def machine_json(m):
+    return {
+        "id": str(m.id),
+        "machine_code": m.machine_code,
+        "name": m.name,
+        "machine_type": m.machine_type,
+        "manufacturer": m.manufacturer or "",
+        "model": m.model or "",
+    }
+
+
+def employee_json(e):
+    return {
+        "id": str(e.id),
+        "employee_code": getattr(e, "code", None),
+        "name": getattr(e, "name", None),
+        "department": str(getattr(e, "department", None)) if getattr(e, "department", None) else None,
+        "role": getattr(e, "role", None)
+    }
+
+
+def seed(n):
+    """Fill the benchmark database with n machines and n employees across 20 departments"""
+    for doc_class in (DepartmentDoc, EmployeeDoc, MachineDoc):
+        doc_class.drop_collection()
+    departments = [DepartmentDoc(name=f"Department {i}").save() for i in range(20)]
+    MachineDoc.objects.insert([
+        MachineDoc(machine_code=f"MCH{i:06d}", name=f"Machine {i}", machine_type="CNC", manufacturer="Acme")
+        for i in range(n)], load_bulk=False)
+    EmployeeDoc.objects.insert([
+        EmployeeDoc(code=f"EMP{i:06d}", name=f"Employee {i}", department=departments[i % 20])
+        for i in range(n)], load_bulk=False)
+
+
+def timed(label, run):
+    start = time.perf_counter()
+    records = run()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<6} {len(records):>8} records in {elapsed:7.3f}s ({len(records) / elapsed:,.0f}/s)")
+    return records
+
+
+def benchmark_serialization(seed_count=None):
+    if seed_count:
+        connect('mes_bench', host=os.getenv('MONGO_BENCH_URI', 'mongodb://localhost:27017/mes_bench'))
+        print(f"Connected to MongoDB benchmark database; seeding {seed_count} machines and employees.")
+        seed(seed_count)
+    else:
+        connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+        print("Connected to MongoDB for the serialization benchmark.")
+
+    cases = [
+        ("machines", MachineDoc, ("machine_code", "name", "machine_type", "manufacturer", "model", "created_at"),
+         machine_json, MACHINE_JSON),
+        ("employees", EmployeeDoc, ("code", "name", "department", "role", "created_at"),
+         employee_json, EMPLOYEE_JSON),
+    ]
+    for name, doc_class, fields, before, after in cases:
+        print(f"- {name}")
+        old = timed("before", lambda: [before(doc) for doc in doc_class.objects().only(*fields).order_by('-created_at')])
+        new = timed("after", lambda: after(list(after.queryset(doc_class).order_by('-created_at'))))
+        print("  payloads identical" if old == new else "  ⚠ payloads differ")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare list API serialization throughput before and after the raw fast path")
+    parser.add_argument("--seed", type=int, metavar="N",
+                        help="benchmark against a scratch mes_bench database seeded with N machines and employees")
+    args = parser.parse_args()
+    benchmark_serialization(args.seed)
@@ -0,0 +1,60 @@
+import argparse
+import os
+from mongoengine import connect, disconnect
+from ledger import SNAPSHOT_CHUNK, record_movement, stock_levels, take_snapshots
+from models_mongo import InventoryItemDoc, StockMovementDoc
+
+
+
+def post_opening_balances():
+    """Seed the ledger with each item's current quantity, for items with no movements yet"""
+    in_ledger = set(StockMovementDoc._get_collection().distinct("item"))
+    posted = 0
+    for item in InventoryItemDoc.objects().only("quantity"):
+        if item.id not in in_ledger and item.quantity:
+            record_movement(item.id, item.quantity, "Opening", reference="Opening balance")
+            posted += 1
+    return posted
+
+
+def reconcile_quantities():
+    """Reset every item's running quantity to its ledger balance; returns the items corrected"""
+    items = {row["_id"]: row.get("quantity") or 0
+             for row in InventoryItemDoc._get_collection().find({}, {"quantity": 1})}
+    item_ids = list(items)
+    corrected = 0
+    for i in range(0, len(item_ids), SNAPSHOT_CHUNK):
+        for item_id, balance in stock_levels(item_ids[i:i + SNAPSHOT_CHUNK]).items():
+            if abs(balance - items[item_id]) > 1e-9:
+                InventoryItemDoc._get_collection().update_one({"_id": item_id}, {"$set": {"quantity": balance}})
+                corrected += 1
+    return corrected
+
+
+def inventory_ledger(opening=False, reconcile=False):
+    connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+
+    print("Connected to MongoDB for the inventory ledger.")
+
+    # --opening once when the ledger is introduced, then snapshots daily
+    if opening:
+        print(f"✅ Posted opening balances for {post_opening_balances()} items")
+
+    taken = take_snapshots()
+    print(f"✅ Took stock snapshots for {len(taken)} day(s)" if taken else "ℹ Stock snapshots already up to date")
+
+    if reconcile:
+        print(f"✅ Reconciled running quantity of {reconcile_quantities()} items with the ledger")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Take daily inventory snapshots")
+    parser.add_argument("--opening", action="store_true", help="post opening balances for items not in the ledger")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="reset InventoryItemDoc.quantity to the ledger balance")
+    args = parser.parse_args()
+    inventory_ledger(args.opening, args.reconcile)
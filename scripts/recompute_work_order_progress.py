@@ -0,0 +1,25 @@
+import os
+from mongoengine import connect, disconnect
+from progress import recompute_produced
+
+
+
+def recompute_work_order_progress():
+    connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+
+    print("Connected to MongoDB for recomputing work order progress.")
+
+    # Rebuild quantity_produced from the production entries; run while ingestion is quiet
+    corrected = recompute_produced()
+    if corrected:
+        print(f"✅ Corrected quantity_produced on {corrected} work orders")
+    else:
+        print("ℹ quantity_produced already matches the production entries")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    recompute_work_order_progress()
@@ -0,0 +1,24 @@
+import os
+from mongoengine import connect, disconnect
+from stats import rebuild_counters
+
+
+
+def reconcile_dashboard_counters():
+    connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+
+    print("Connected to MongoDB for reconciling dashboard counters.")
+
+    # Recount every collection and replace the maintained counters
+    counts = rebuild_counters()
+    for collection, buckets in counts.items():
+        summary = ", ".join(f"{bucket}: {n}" for bucket, n in sorted(buckets.items())) or "empty"
+        print(f"- {collection} ({summary})")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    reconcile_dashboard_counters()
@@ -0,0 +1,22 @@
+import os
+from mongoengine import connect, disconnect
+from models_mongo import ToolDoc
+
+
+
+def refresh_low_stock():
+    connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+
+    print("Connected to MongoDB for refreshing low stock flags.")
+
+    # Recompute is_low_stock for every tool, including tools saved before the flag existed
+    modified = ToolDoc.refresh_low_stock()
+    print(f"✅ Updated is_low_stock on {modified} tool(s)")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    refresh_low_stock()
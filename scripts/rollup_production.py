@@ -0,0 +1,30 @@
+import os
+import sys
+from mongoengine import connect, disconnect
+from rollups import rebuild_rollups, rollup_production
+
+
+
+def run_rollups(rebuild=False):
+    connect('mes_db', host=os.getenv('MONGO_URI', 'mongodb://localhost:27017/mes_db'))
+
+    print("Connected to MongoDB for production rollups.")
+
+    # Incremental by default; --rebuild recomputes every bucket from raw entries
+    if rebuild:
+        watermark = rebuild_rollups()
+        print(f"✅ Rebuilt production rollups up to {watermark}")
+    else:
+        watermark = rollup_production()
+        if watermark is None:
+            print("ℹ Another rollup run is in progress")
+        else:
+            print(f"✅ Production rollups up to date as of {watermark}")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    run_rollups(rebuild="--rebuild" in sys.argv[1:])
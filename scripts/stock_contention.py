@@ -0,0 +1,81 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mongoengine import connect, disconnect
+from models_mongo import EmployeeDoc, ToolDoc, ToolIssuanceDoc
+from sequences import buffered_codes
+from stock import InsufficientStock, issue_tool, return_tool
+
+
+
+def hammer_issues(tool, employee, threads, attempts):
+    """Issue one unit per attempt from every thread; returns the issuances that succeeded"""
+    def worker(_):
+        issued = []
+        for _ in range(attempts):
+            issuance = ToolIssuanceDoc(issue_number=buffered_codes("TI")[0], tool=tool.id,
+                                       employee=employee.id, quantity_issued=1)
+            try:
+                issued.append(issue_tool(issuance).id)
+            except InsufficientStock:
+                pass
+        return issued
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return [issuance_id for issued in pool.map(worker, range(threads)) for issuance_id in issued]
+
+
+def hammer_returns(issuance_ids, threads):
+    """Return every issuance from every thread at once; only one return each may succeed"""
+    def worker(_):
+        return sum(return_tool(issuance_id, 1) for issuance_id in issuance_ids)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return sum(pool.map(worker, range(threads)))
+
+
+def stock_contention(stock, threads, attempts):
+    connect('mes_bench', host=os.getenv('MONGO_BENCH_URI', 'mongodb://localhost:27017/mes_bench'))
+
+    print("Connected to MongoDB benchmark database for the stock contention test.")
+
+    tool = ToolDoc(tool_code=f"BENCH{int(time.time())}", name="Contention test tool", tool_type="Test",
+                   quantity_available=stock, minimum_stock=1).save()
+    employee = EmployeeDoc(code=f"BENCH{int(time.time())}", name="Contention tester").save()
+
+    start = time.perf_counter()
+    issued = hammer_issues(tool, employee, threads, attempts)
+    elapsed = time.perf_counter() - start
+    tool.reload()
+    issuances = ToolIssuanceDoc.objects(tool=tool).count()
+    print(f"- {threads} threads x {attempts} attempts on {stock} units: {len(issued)} issued "
+          f"in {elapsed:.2f}s ({threads * attempts / elapsed:,.0f} attempts/s)")
+    print(f"  quantity_available {tool.quantity_available}, issuances saved {issuances}, "
+          f"is_low_stock {tool.is_low_stock}")
+    issues_ok = (len(issued) == min(stock, threads * attempts) and issuances == len(issued)
+                 and tool.quantity_available == stock - len(issued) and tool.quantity_available >= 0)
+
+    returned = hammer_returns(issued, threads)
+    tool.reload()
+    print(f"- {threads} threads returning each issuance: {returned} returns booked, "
+          f"quantity_available {tool.quantity_available}")
+    returns_ok = returned == len(issued) and tool.quantity_available == stock
+
+    ToolIssuanceDoc.objects(tool=tool).delete()
+    tool.delete()
+    employee.delete()
+    print("✅ No oversubscription" if issues_ok and returns_ok else "❌ Stock and issuances diverged")
+
+    disconnect()
+    print("Disconnected from MongoDB.")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hammer a single tool's stock from many threads")
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=50, help="issue attempts per thread")
+    args = parser.parse_args()
+    stock_contention(args.stock, args.threads, args.attempts)
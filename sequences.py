@@ -0,0 +1,157 @@
+"""Atomic per-prefix, per-day code sequences backed by the counters collection.
+
+Codes keep the PREFIXYYYYMMDDNNNN format; past 9999 codes in a day the
+number widens to five digits and more. Each number is handed out by a
+single find_one_and_update with $inc, so concurrent callers never get the
+same code and no probing of the target collection is needed. CodeBuffer
+reserves whole blocks in that one operation and keeps a per-process stock
+of them, so most codes taken through buffered_codes() cost no round trip
+at all; the create API fills missing codes from it.
+"""
+import os
+import re
+import threading
+from datetime import datetime
+
+from models_mongo import (CounterDoc, CustomerDoc, EmployeeDoc, GRNDoc, InspectionDoc,
+                          MachineDoc, ProductDoc, PurchaseOrderDoc, SalesOrderDoc,
+                          ToolDoc, ToolIssuanceDoc, VendorDoc, WorkOrderDoc)
+
+# Prefix -> (document, code field) for every code series in use
+CODE_FIELDS = {
+    "WO": (WorkOrderDoc, "work_order_number"),
+    "INS": (InspectionDoc, "inspection_number"),
+    "TI": (ToolIssuanceDoc, "issue_number"),
+    "PO": (PurchaseOrderDoc, "po_number"),
+    "SO": (SalesOrderDoc, "order_number"),
+    "GRN": (GRNDoc, "grn_number"),
+    "CUST": (CustomerDoc, "customer_code"),
+    "EMP": (EmployeeDoc, "code"),
+    "MCH": (MachineDoc, "machine_code"),
+    "TOOL": (ToolDoc, "tool_code"),
+    "VEND": (VendorDoc, "vendor_code"),
+    "PROD": (ProductDoc, "product_code"),
+}
+
+
+def sequence_key(prefix, when=None):
+    """Counter key for a prefix on a given day (today by default)"""
+    return f"{prefix}{(when or datetime.now()).strftime('%Y%m%d')}"
+
+
+def format_code(key, seq):
+    return f"{key}{seq:04d}"
+
+
+def _highest_existing(key, doc_class, field_name):
+    """Highest sequence already used for key by codes issued before the counter existed.
+
+    Compared by width first: as strings, a widened KEY10000 sorts below KEY9999."""
+    db_field = doc_class._fields[field_name].db_field
+    pipeline = [
+        {"$match": {db_field: {"$regex": f"^{re.escape(key)}[0-9]+$"}}},
+        {"$project": {"code": f"${db_field}", "width": {"$strLenCP": f"${db_field}"}}},
+        {"$sort": {"width": -1, "code": -1}},
+        {"$limit": 1},
+    ]
+    latest = next(doc_class._get_collection().aggregate(pipeline), None)
+    return int(latest["code"][len(key):]) if latest else 0
+
+
+_seeded = set()  # counter keys this process has seen exist; a counter is never removed
+
+
+def reserve_block(key, count, doc_class=None, field_name=None):
+    """Atomically reserve count consecutive sequence numbers for key.
+
+    Returns the first number of the block. Before the counter exists,
+    doc_class/field_name are used to seed it past any codes already stored
+    for the same key; the seed is a $max upsert, so concurrent first callers
+    all seed before any of them increments and none can get a used number.
+    Once a key is known to be seeded, taking numbers is a single
+    find_one_and_update.
+    """
+    if doc_class is not None and key not in _seeded:
+        counters = CounterDoc._get_collection()
+        if counters.count_documents({"_id": key}, limit=1) == 0:
+            counters.update_one({"_id": key}, {"$max": {"seq": _highest_existing(key, doc_class, field_name)}},
+                                upsert=True)
+        _seeded.add(key)
+    counter = CounterDoc.objects(key=key).modify(upsert=True, new=True, inc__seq=count)
+    return counter.seq - count + 1
+
+
+def next_sequence(key, doc_class=None, field_name=None):
+    """Atomically take the next sequence number for key"""
+    return reserve_block(key, 1, doc_class, field_name)
+
+
+def _code_fields(prefix, doc_class, field_name):
+    if doc_class is None:
+        return CODE_FIELDS.get(prefix, (None, None))
+    return doc_class, field_name
+
+
+def next_code(prefix, doc_class=None, field_name=None):
+    """Next PREFIXYYYYMMDDNNNN code for prefix"""
+    doc_class, field_name = _code_fields(prefix, doc_class, field_name)
+    key = sequence_key(prefix)
+    return format_code(key, next_sequence(key, doc_class, field_name))
+
+
+class CodeBuffer:
+    """Per-process stock of pre-reserved codes for one prefix.
+
+    Codes are taken from a locally reserved block and a new block of
+    block_size is reserved only when it runs out or the day changes. Unused
+    codes of a block are skipped. The buffer resets itself after a fork so
+    pre-forked workers never share a block.
+    """
+
+    def __init__(self, prefix, block_size=100, doc_class=None, field_name=None):
+        self.prefix = prefix
+        self.block_size = block_size
+        self.doc_class, self.field_name = _code_fields(prefix, doc_class, field_name)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._key = None
+        self._next = 0
+        self._end = 0
+
+    def take(self, count=1):
+        """Return count codes, reserving new blocks as needed"""
+        codes = []
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            key = sequence_key(self.prefix)
+            if key != self._key:
+                self._key, self._next, self._end = key, 0, 0
+            while len(codes) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(codes))
+                    self._next = reserve_block(key, size, self.doc_class, self.field_name)
+                    self._end = self._next + size
+                take = min(count - len(codes), self._end - self._next)
+                codes.extend(format_code(key, seq) for seq in range(self._next, self._next + take))
+                self._next += take
+        return codes
+
+    def next_code(self):
+        return self.take(1)[0]
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def buffered_codes(prefix, count=1, block_size=100):
+    """Take count codes for prefix from this process's shared CodeBuffer"""
+    with _buffers_lock:
+        buffer = _buffers.get(prefix)
+        if buffer is None:
+            buffer = _buffers[prefix] = CodeBuffer(prefix, block_size)
+    return buffer.take(count)
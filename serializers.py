@@ -0,0 +1,95 @@
+"""Raw-document serialization for the JSON APIs.
+
+Hydrating a MongoEngine Document per row converts every field, and reading
+a ReferenceField dereferences it with one query per row; for list APIs that
+costs more than the query itself. RawSerializer instead maps the plain
+dicts returned by as_pymongo() through a declared field map and resolves
+referenced names for a whole batch with one $in query per referenced
+collection.
+"""
+from utils import json_value
+
+
+class Ref:
+    """Field map entry rendering a reference as a field of the referenced document"""
+
+    def __init__(self, field, document, name_field):
+        self.field = field
+        self.document = document
+        self.name_field = name_field
+
+
+class RawSerializer:
+    """Turn batches of raw documents into API records.
+
+    fields maps each output key, in output order, to one of:
+      "field"            the raw value, references as their id
+      ("field", default)  the raw value, or default when missing or None
+      Ref(...)           the referenced document's name_field, None if it is gone
+    """
+
+    def __init__(self, fields):
+        self._entries = []
+        self._refs = []
+        projection = {"created_at"}  # keyset cursors need it
+        for key, spec in fields.items():
+            if isinstance(spec, Ref):
+                self._refs.append(spec)
+                projection.add(spec.field)
+            else:
+                spec = spec if isinstance(spec, tuple) else (spec, None)
+                if spec[0] != "_id":
+                    projection.add(spec[0])
+            self._entries.append((key, spec))
+        self.projection = sorted(projection)
+
+    @classmethod
+    def for_document(cls, document, fields):
+        """Serializer for document's fields as {"id", *fields}, applying the
+        same non-callable defaults MongoEngine would for missing values"""
+        field_map = {"id": "_id"}
+        for name in fields:
+            default = document._fields[name].default
+            field_map[name] = (name, None if callable(default) else default)
+        return cls(field_map)
+
+    def queryset(self, document):
+        """Raw queryset loading only the fields this serializer reads"""
+        return document.objects().only(*self.projection).as_pymongo()
+
+    def _names(self, batch):
+        """(document, id) -> {name field: value} for every reference in the batch"""
+        wanted = {}
+        for ref in self._refs:
+            ids, name_fields = wanted.setdefault(ref.document, (set(), set()))
+            name_fields.add(ref.name_field)
+            for raw in batch:
+                value = raw.get(ref.field)
+                if value is not None:
+                    ids.add(getattr(value, "id", value))
+
+        names = {}
+        for document, (ids, name_fields) in wanted.items():
+            if not ids:
+                continue
+            rows = document._get_collection().find({"_id": {"$in": list(ids)}}, dict.fromkeys(name_fields, 1))
+            for row in rows:
+                names[(document, row["_id"])] = row
+        return names
+
+    def __call__(self, batch):
+        names = self._names(batch) if self._refs else {}
+        records = []
+        for raw in batch:
+            record = {}
+            for key, spec in self._entries:
+                if isinstance(spec, Ref):
+                    value = raw.get(spec.field)
+                    target = names.get((spec.document, getattr(value, "id", value))) if value is not None else None
+                    record[key] = json_value(target.get(spec.name_field)) if target else None
+                else:
+                    field, default = spec
+                    value = raw.get(field)
+                    record[key] = json_value(value if value is not None else default)
+            records.append(record)
+        return records
@@ -7,7 +7,7 @@
 window.ManufacturingERP = {
     // Configuration
     config: {
-        autoRefreshInterval: 300000, // 5 minutes
+        autoRefreshInterval: 15000, // 15 seconds; list refreshes only fetch changed rows
         notificationDuration: 5000,
         chartColors: {
             primary: '#1e40af',
@@ -221,11 +221,17 @@ window.ManufacturingERP = {
         };
         
         notification.className = `alert alert-${type} alert-dismissible fade show shadow-sm`;
-        notification.innerHTML = `
-            <i class="${iconMap[type]} me-2"></i>
-            ${message}
-            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
-        `;
+        // A string message is plain text: it can carry user-entered values such as a
+        // work order number. Pass a DOM node for markup such as a link.
+        var icon = document.createElement('i');
+        icon.className = `${iconMap[type]} me-2`;
+        var closeButton = document.createElement('button');
+        closeButton.type = 'button';
+        closeButton.className = 'btn-close';
+        closeButton.setAttribute('data-bs-dismiss', 'alert');
+        notification.appendChild(icon);
+        notification.appendChild(message instanceof Node ? message : document.createTextNode(message));
+        notification.appendChild(closeButton);
         
         container.appendChild(notification);
         
@@ -240,13 +246,17 @@ window.ManufacturingERP = {
 
     // Auto-refresh functionality
     initAutoRefresh: function() {
-        // Only auto-refresh on dashboard and list pages
-        var autoRefreshPages = ['/dashboard', '/employees', '/machines', '/tools', '/work-orders', '/inspections'];
-        var currentPath = window.location.pathname;
-        
-        if (autoRefreshPages.some(page => currentPath.includes(page))) {
+        // Pages with a live feed (dashboard) are updated by the server as data changes
+        var liveFeed = document.querySelector('[data-live-feed]');
+        if (liveFeed && window.EventSource) {
+            this.initLiveFeed(liveFeed.getAttribute('data-live-feed'));
+            return;
+        }
+
+        // List pages whose table body offers a partial refresh endpoint
+        if (document.querySelector('[data-refresh-url]')) {
             setInterval(function() {
-                // Check if user is active (moved mouse in last 5 minutes)
+                // Only refresh while the page is visible
                 if (ManufacturingERP.isUserActive()) {
                     ManufacturingERP.refreshPageData();
                 }
@@ -254,26 +264,105 @@ window.ManufacturingERP = {
         }
     },
 
+    // Subscribe to the Server-Sent Events dashboard feed
+    initLiveFeed: function(url) {
+        var source = new EventSource(url);
+
+        source.addEventListener('stats', function(event) {
+            var stats = JSON.parse(event.data);
+            Object.keys(stats).forEach(function(key) {
+                document.querySelectorAll('[data-live-stat="' + key + '"]').forEach(function(el) {
+                    el.textContent = stats[key];
+                });
+            });
+        });
+
+        source.addEventListener('work_order', function(event) {
+            var wo = JSON.parse(event.data);
+            ManufacturingERP.prependRecentWorkOrder(wo);
+            ManufacturingERP.showNotification('New work order ' + wo.work_order_number, 'info');
+        });
+
+        // The server ends each stream after a few minutes and EventSource reconnects
+        // by itself after the retry delay it sent; just close it when leaving the page
+        window.addEventListener('beforeunload', function() {
+            source.close();
+        });
+    },
+
+    // Add a work order pushed by the live feed to the Recent Work Orders table
+    prependRecentWorkOrder: function(wo) {
+        var tbody = document.querySelector('[data-live-work-orders]');
+        if (!tbody) {
+            return;
+        }
+        var row = document.createElement('tr');
+        var cells = [wo.work_order_number, '-', wo.status, '-', wo.quantity_produced + ' / ' + wo.quantity,
+                     wo.created_at.substring(0, 10)];
+        cells.forEach(function(value, index) {
+            var cell = document.createElement('td');
+            if (index === 0) {
+                var strong = document.createElement('strong');
+                strong.textContent = value;
+                cell.appendChild(strong);
+            } else if (index === 2) {
+                var badge = document.createElement('span');
+                badge.className = 'badge bg-secondary';
+                badge.textContent = value;
+                cell.appendChild(badge);
+            } else {
+                cell.textContent = value;
+            }
+            row.appendChild(cell);
+        });
+        tbody.insertBefore(row, tbody.firstChild);
+        while (tbody.rows.length > 5) {
+            tbody.deleteRow(tbody.rows.length - 1);
+        }
+    },
+
     // Check if user is active
     isUserActive: function() {
         // Simple activity detection - in production, this would be more sophisticated
         return document.visibilityState === 'visible';
     },
 
-    // Refresh page data
+    // Refresh list rows changed since the last refresh
     refreshPageData: function() {
-        // In a real application, this would make AJAX calls to refresh data
-        console.log('Auto-refreshing page data...');
-        
-        // Show refresh indicator
-        var indicator = document.createElement('div');
-        indicator.className = 'position-fixed top-0 end-0 p-3';
-        indicator.innerHTML = '<div class="toast show" role="alert"><div class="toast-body"><i class="fas fa-sync-alt fa-spin me-2"></i>Refreshing data...</div></div>';
-        document.body.appendChild(indicator);
-        
-        setTimeout(function() {
-            document.body.removeChild(indicator);
-        }, 2000);
+        // New rows are only added on the first page of a list
+        var firstPage = !/[?&](after|before|page)=/.test(window.location.search);
+
+        document.querySelectorAll('[data-refresh-url]').forEach(function(tbody) {
+            var url = tbody.getAttribute('data-refresh-url') +
+                '?since=' + encodeURIComponent(tbody.getAttribute('data-refresh-since'));
+
+            fetch(url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+                .then(function(response) {
+                    return response.ok ? response.json() : Promise.reject(response.status);
+                })
+                .then(function(delta) {
+                    if (delta.more) {
+                        // Too many changes for a delta; fall back to a full reload
+                        window.location.reload();
+                        return;
+                    }
+                    delta.rows.forEach(function(row) {
+                        var parser = document.createElement('tbody');
+                        parser.innerHTML = row.html.trim();
+                        var fresh = parser.firstElementChild;
+                        var existing = tbody.querySelector('tr[data-row-id="' + row.id + '"]');
+                        if (existing) {
+                            existing.replaceWith(fresh);
+                        } else if (row.created && firstPage) {
+                            tbody.insertBefore(fresh, tbody.firstChild);
+                        }
+                    });
+                    tbody.setAttribute('data-refresh-since', delta.since);
+                })
+                .catch(function(error) {
+                    console.log('Partial refresh failed:', error);
+                });
+        });
     },
 
     // Keyboard shortcuts
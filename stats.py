@@ -0,0 +1,211 @@
+"""Dashboard statistics shared by dashboard() and reports_dashboard().
+
+Status buckets for the counted collections are kept incrementally in a
+single dashboard_counters document: routes call record_created() and
+record_changed() after writes, which apply a $inc, and the dashboards read
+that one document. rebuild_counters() recounts everything with one $group
+aggregation per collection, run concurrently, to create the document or
+repair drift (see scripts/reconcile_dashboard_counters.py).
+
+The views read the combined stats through the shared cache in cache.py, so
+many open dashboards cost one recomputation per DASHBOARD_CACHE_TTL. Every
+counter change also marks the cached stats stale, so the next read starts
+that recomputation without waiting for the TTL.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from cache import get_or_refresh, invalidate
+from models_mongo import (LOW_STOCK_EXPR, DashboardCounterDoc, EmployeeDoc, InspectionDoc,
+                          MachineDoc, PurchaseOrderDoc, SalesOrderDoc, ToolDoc, WorkOrderDoc)
+
+# Collection -> (document, field whose values are counted)
+BUCKET_FIELDS = {
+    "work_orders": (WorkOrderDoc, "status"),
+    "inspections": (InspectionDoc, "status"),
+    "purchase_orders": (PurchaseOrderDoc, "status"),
+    "sales_orders": (SalesOrderDoc, "status"),
+    "employees": (EmployeeDoc, "is_active"),
+    "machines": (MachineDoc, "is_active"),
+}
+_COUNTED = {doc_class: (name, field) for name, (doc_class, field) in BUCKET_FIELDS.items()}
+
+COUNTERS_KEY = "dashboard"
+
+# Seconds the dashboards serve cached stats before one worker refreshes them
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "30"))
+STATS_CACHE_KEY = "dashboard_stats"
+
+# compute_stats() reads run on _executor; rebuild_counters() may be called from
+# one of them and blocks on its recounts, so those get a pool of their own
+_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="stats")
+_rebuild_executor = ThreadPoolExecutor(max_workers=len(BUCKET_FIELDS), thread_name_prefix="stats-rebuild")
+
+
+def _bucket(value):
+    """Counter key for a field value; Mongo keys are strings without dots"""
+    return str(value).replace(".", "_")
+
+
+def bucket_counts(doc_class, field):
+    """Count documents per value of field with one $group aggregation"""
+    pipeline = [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+    return {_bucket(row["_id"]): row["count"] for row in doc_class.objects.aggregate(pipeline)}
+
+
+def _inc_counters(increments):
+    increments = {path: n for path, n in increments.items() if n}
+    if increments:
+        DashboardCounterDoc._get_collection().update_one(
+            {"_id": COUNTERS_KEY}, {"$inc": increments}, upsert=True)
+        invalidate(STATS_CACHE_KEY)
+
+
+def record_created(*docs):
+    """Count newly created documents in the dashboard counters"""
+    increments = {}
+    for doc in docs:
+        name, field = _COUNTED[type(doc)]
+        path = f"counts.{name}.{_bucket(getattr(doc, field))}"
+        increments[path] = increments.get(path, 0) + 1
+    _inc_counters(increments)
+
+
+def record_changed(doc, old_value):
+    """Move a document between buckets after its counted field changed from old_value"""
+    name, field = _COUNTED[type(doc)]
+    new_value = getattr(doc, field)
+    if _bucket(new_value) != _bucket(old_value):
+        _inc_counters({f"counts.{name}.{_bucket(old_value)}": -1,
+                       f"counts.{name}.{_bucket(new_value)}": 1})
+
+
+def rebuild_counters():
+    """Recount every bucket from scratch and replace the counters document"""
+    futures = {name: _rebuild_executor.submit(bucket_counts, doc_class, field)
+               for name, (doc_class, field) in BUCKET_FIELDS.items()}
+    counts = {name: future.result() for name, future in futures.items()}
+    DashboardCounterDoc._get_collection().replace_one(
+        {"_id": COUNTERS_KEY}, {"counts": counts, "rebuilt_at": datetime.utcnow()}, upsert=True)
+    return counts
+
+
+def read_counters():
+    """Current bucket counts, building the counters document on first use"""
+    row = DashboardCounterDoc._get_collection().find_one({"_id": COUNTERS_KEY})
+    if row is None or row.get("rebuilt_at") is None:
+        # Never rebuilt: any counts present are only increments since deployment
+        return rebuild_counters()
+    counts = row["counts"]
+    return {name: counts.get(name, {}) for name in BUCKET_FIELDS}
+
+
+def tool_counts():
+    """Total and low-stock tool counts in one $facet aggregation"""
+    pipeline = [{"$facet": {
+        "total": [{"$count": "n"}],
+        "low_stock": [{"$match": {"$expr": LOW_STOCK_EXPR}}, {"$count": "n"}],
+    }}]
+    row = next(ToolDoc.objects.aggregate(pipeline))
+    return {name: row[name][0]["n"] if row[name] else 0 for name in ("total", "low_stock")}
+
+
+def low_stock_tools(limit=None):
+    """Tools at or below minimum stock, lowest quantity first, via the is_low_stock index"""
+    queryset = (ToolDoc.objects(is_low_stock=True)
+                .only("tool_code", "name", "quantity_available", "minimum_stock", "location")
+                .order_by("quantity_available"))
+    return list(queryset[:limit] if limit else queryset)
+
+
+def work_order_output():
+    """Ordered and produced quantity over work orders that are not cancelled.
+
+    Reads each work order's stored quantity_produced (see progress.py),
+    counting at most the ordered quantity per work order."""
+    pipeline = [
+        {"$match": {"status": {"$ne": "Cancelled"}}},
+        {"$group": {
+            "_id": None,
+            "ordered": {"$sum": "$quantity"},
+            "produced": {"$sum": {"$min": [{"$ifNull": ["$quantity_produced", 0]}, "$quantity"]}},
+        }},
+    ]
+    row = next(WorkOrderDoc.objects.aggregate(pipeline), None)
+    return {"ordered": row["ordered"], "produced": row["produced"]} if row else {"ordered": 0, "produced": 0}
+
+
+def compute_stats():
+    """Bucket counts for the dashboards: the counters document plus tool stock and
+    work order output, read concurrently"""
+    counters = _executor.submit(read_counters)
+    tools = _executor.submit(tool_counts)
+    output = _executor.submit(work_order_output)
+    raw = dict(counters.result())
+    raw["tools"] = tools.result()
+    raw["work_order_output"] = output.result()
+    return raw
+
+
+def cached_stats():
+    """compute_stats() through the shared stale-while-revalidate cache"""
+    return get_or_refresh(STATS_CACHE_KEY, compute_stats, ttl=DASHBOARD_CACHE_TTL)
+
+
+def _rate(part, whole):
+    return round((part / whole * 100) if whole > 0 else 0, 1)
+
+
+def dashboard_stats(raw=None):
+    """Stats block for dashboard.html"""
+    raw = raw or cached_stats()
+    return {
+        "work_orders": sum(raw["work_orders"].values()),
+        "pending_inspections": raw["inspections"].get("Pending", 0),
+        "low_stock_tools": raw["tools"]["low_stock"],
+        "active_employees": raw["employees"].get("True", 0),
+        "active_machines": raw["machines"].get("True", 0),
+        "pending_pos": raw["purchase_orders"].get("Pending", 0),
+    }
+
+
+def reports_stats(raw=None):
+    """Stats block for reports/dashboard.html"""
+    raw = raw or cached_stats()
+    work_orders = raw["work_orders"]
+    inspections = raw["inspections"]
+    tools = raw["tools"]
+    output = raw.get("work_order_output", {"ordered": 0, "produced": 0})
+
+    total_work_orders = sum(work_orders.values())
+    completed_work_orders = work_orders.get("Completed", 0)
+    total_inspections = sum(inspections.values())
+    passed_inspections = inspections.get("Passed", 0)
+
+    return {
+        "production": {
+            "completion_rate": _rate(completed_work_orders, total_work_orders),
+            "completed_work_orders": completed_work_orders,
+            "total_work_orders": total_work_orders,
+            "in_progress_work_orders": work_orders.get("In Progress", 0),
+            "output_rate": _rate(output["produced"], output["ordered"]),
+            "quantity_produced": output["produced"],
+            "quantity_ordered": output["ordered"]
+        },
+        "quality": {
+            "pass_rate": _rate(passed_inspections, total_inspections),
+            "passed_inspections": passed_inspections,
+            "failed_inspections": inspections.get("Failed", 0),
+            "total_inspections": total_inspections
+        },
+        "inventory": {
+            "stock_health": _rate(tools["total"] - tools["low_stock"], tools["total"]),
+            "low_stock_tools": tools["low_stock"],
+            "total_tools": tools["total"]
+        },
+        "procurement": {
+            "fulfillment_rate": 85,  # Mock data
+            "pending_pos": raw["purchase_orders"].get("Pending", 0)
+        }
+    }
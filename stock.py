@@ -0,0 +1,118 @@
+"""Atomic stock reservations for tools and inventory items.
+
+Stock is taken with one conditional update that matches only while enough
+is available (quantity >= n), so concurrent issues can never oversubscribe
+and no read-modify-write of the whole document is needed. The issuance
+record is saved right after; if that fails the reservation is released
+again, so stock and issuances stay in step without a transaction.
+
+Tool updates also recompute is_low_stock in the same pipeline update.
+Inventory item movements are also appended to the ledger (ledger.py);
+InventoryItemDoc.quantity stays the running figure reservations check.
+"""
+from datetime import datetime
+
+from ledger import record_movement
+from models_mongo import LOW_STOCK_EXPR, InventoryItemDoc, ToolDoc, ToolIssuanceDoc
+
+# document -> (stock field, pipeline stages re-deriving fields that depend on it)
+STOCK_FIELDS = {
+    ToolDoc: ("quantity_available", [{"$set": {"is_low_stock": LOW_STOCK_EXPR}}]),
+    InventoryItemDoc: ("quantity", []),
+}
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def adjust_stock(doc_class, item_id, delta):
+    """Add delta to an item's stock in one update, refusing to go below zero.
+
+    Returns True when applied; False when a negative delta exceeds the
+    stock available (or the item does not exist)."""
+    field, derived = STOCK_FIELDS[doc_class]
+    query = {"_id": item_id}
+    if delta < 0:
+        query[field] = {"$gte": -delta}
+    update = [{"$set": {field: {"$add": [{"$ifNull": [f"${field}", 0]}, delta]}}}] + derived
+    return doc_class._get_collection().update_one(query, update).modified_count == 1
+
+
+def reserve_stock(doc_class, item_id, quantity):
+    if not adjust_stock(doc_class, item_id, -quantity):
+        raise InsufficientStock()
+
+
+def _ref_id(doc, field):
+    """Id a ReferenceField points at, without dereferencing it"""
+    value = doc._data.get(field)
+    return getattr(value, "id", value)
+
+
+def _save_reserved(doc, doc_class, item_id, quantity):
+    reserve_stock(doc_class, item_id, quantity)
+    try:
+        doc.save()
+    except Exception:
+        adjust_stock(doc_class, item_id, quantity)
+        raise
+    return doc
+
+
+def issue_tool(issuance):
+    """Take issuance.quantity_issued from its tool and save the issuance.
+
+    Raises InsufficientStock, leaving nothing saved, when the tool does not
+    have that many available."""
+    return _save_reserved(issuance, ToolDoc, _ref_id(issuance, "tool"), issuance.quantity_issued)
+
+
+def issue_material(material_issue, user=None):
+    """Take material_issue.quantity from its inventory item, save the issue and post it to the ledger"""
+    item_id = _ref_id(material_issue, "item")
+    _save_reserved(material_issue, InventoryItemDoc, item_id, material_issue.quantity)
+    record_movement(item_id, -material_issue.quantity, "Issue", reference=material_issue.id,
+                    document_date=material_issue.date, user=user)
+    return material_issue
+
+
+def receive_stock(item_id, quantity, reference=None, document_date=None, user=None):
+    """Book a receipt, e.g. a GRN, to the ledger and the item's running quantity"""
+    record_movement(item_id, quantity, "Receipt", reference, document_date, user)
+    adjust_stock(InventoryItemDoc, item_id, quantity)
+
+
+def adjust_inventory(item_id, delta, reason=None, user=None):
+    """Correct an item's stock by delta, e.g. after a stock count; raises
+    InsufficientStock if that would take it below zero"""
+    if delta < 0:
+        reserve_stock(InventoryItemDoc, item_id, -delta)
+    else:
+        adjust_stock(InventoryItemDoc, item_id, delta)
+    record_movement(item_id, delta, "Adjustment", reason, user=user)
+
+
+def return_tool(issuance_id, quantity, returned_at=None):
+    """Book quantity of an issuance as returned and put it back in stock.
+
+    The issuance is updated first, only while quantity_returned + quantity
+    does not exceed quantity_issued, so concurrent returns cannot return more
+    than was issued. Returns False when that limit would be exceeded."""
+    returned_at = returned_at or datetime.utcnow()
+    issuances = ToolIssuanceDoc._get_collection()
+    returned = {"$add": [{"$ifNull": ["$quantity_returned", 0]}, quantity]}
+    issuance = issuances.find_one_and_update(
+        {"_id": issuance_id, "$expr": {"$lte": [returned, "$quantity_issued"]}},
+        [{"$set": {"quantity_returned": returned}},
+         {"$set": {
+             "status": {"$cond": [{"$eq": ["$quantity_returned", "$quantity_issued"]},
+                                  "Fully Returned", "Partially Returned"]},
+             "actual_return_date": {"$cond": [{"$eq": ["$quantity_returned", "$quantity_issued"]},
+                                              returned_at, "$actual_return_date"]},
+         }}],
+        projection={"tool": 1})
+    if issuance is None:
+        return False
+    adjust_stock(ToolDoc, issuance["tool"], quantity)
+    return True
@@ -0,0 +1,70 @@
+"""The streaming CSV / XLSX writers and the Export modal's date ranges.
+
+No database; skipped when mongoengine (needed to import the exports module)
+is not installed.
+"""
+import csv
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("mongoengine")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exports import csv_chunks, resolve_date_range, xlsx_chunks  # noqa: E402
+
+HEADER = ["Date", "Shift", "Quantity", "Active"]
+BATCHES = [
+    [[datetime(2025, 1, 15), "A", 120, True], [datetime(2025, 1, 15, 14, 30), "B", 80.5, False]],
+    [[None, 'Night, "late"', 0, None]],
+]
+
+
+def test_csv_one_chunk_per_batch():
+    chunks = list(csv_chunks(HEADER, iter(BATCHES)))
+    assert len(chunks) == len(BATCHES) + 1
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows == [
+        HEADER,
+        ["2025-01-15", "A", "120", "Yes"],
+        ["2025-01-15 14:30", "B", "80.5", "No"],
+        ["", 'Night, "late"', "0", ""],
+    ]
+
+
+def test_xlsx_is_a_readable_workbook():
+    data = b"".join(xlsx_chunks(HEADER, iter(BATCHES), sheet_name="Production <daily>"))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert {"[Content_Types].xml", "xl/workbook.xml", "xl/worksheets/sheet1.xml"} <= set(archive.namelist())
+        assert 'name="Production &lt;daily&gt;"' in archive.read("xl/workbook.xml").decode("utf-8")
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert sheet.count("<row>") == 4
+    assert "<c><v>120</v></c>" in sheet and "<c><v>80.5</v></c>" in sheet
+    assert '<t xml:space="preserve">2025-01-15 14:30</t>' in sheet
+    assert '<t xml:space="preserve">Night, "late"</t>' in sheet
+    assert sheet.endswith("</sheetData></worksheet>")
+
+
+def test_xlsx_drops_characters_xml_cannot_hold():
+    data = b"".join(xlsx_chunks(["Remarks"], iter([[["bad\x01value & <more>"]]])))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert "badvalue &amp; &lt;more&gt;" in sheet
+
+
+def test_date_ranges():
+    today = datetime(2025, 5, 14)  # a Wednesday
+    assert resolve_date_range("today", today=today) == (today, datetime(2025, 5, 15))
+    assert resolve_date_range("week", today=today)[0] == datetime(2025, 5, 12)
+    assert resolve_date_range("month", today=today)[0] == datetime(2025, 5, 1)
+    assert resolve_date_range("quarter", today=today)[0] == datetime(2025, 4, 1)
+    assert resolve_date_range("custom", datetime(2025, 1, 1), datetime(2025, 1, 31)) == \
+        (datetime(2025, 1, 1), datetime(2025, 2, 1))
+    with pytest.raises(ValueError):
+        resolve_date_range("custom", datetime(2025, 2, 1), datetime(2025, 1, 1))
@@ -0,0 +1,80 @@
+"""Posting a GRN saves it and books the receipt to the inventory ledger.
+
+Runs against a scratch database (MONGO_TEST_URI); skipped when Flask or a
+MongoDB server is not available.
+"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_wtf")
+mongoengine = pytest.importorskip("mongoengine")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017/mes_test")
+
+
+@pytest.fixture(scope="module")
+def database():
+    connection = mongoengine.connect("mes_test", host=MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        connection.admin.command("ping")
+    except Exception:
+        mongoengine.disconnect()
+        pytest.skip(f"MongoDB not reachable at {MONGO_TEST_URI}")
+    connection.drop_database("mes_test")
+    yield connection
+    connection.drop_database("mes_test")
+    mongoengine.disconnect()
+
+
+@pytest.fixture
+def client(database):
+    from flask import Flask
+    from flask_login import LoginManager
+    from models_mongo import UserDoc
+    from routes_final import main_bp
+
+    app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), "..", "templates"))
+    app.config.update(SECRET_KEY="test", WTF_CSRF_ENABLED=False, TESTING=True)
+    login_manager = LoginManager(app)
+    login_manager.user_loader(lambda user_id: UserDoc.objects(id=user_id).first())
+    app.register_blueprint(main_bp)
+
+    user = UserDoc(username="storekeeper", email="store@example.com", role="Storekeeper")
+    user.set_password("secret")
+    user.save()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = str(user.id)
+    yield client
+    user.delete()
+
+
+def test_post_grn_books_receipt(client):
+    from models_mongo import GRNDoc, InventoryItemDoc, StockMovementDoc, VendorDoc
+
+    vendor = VendorDoc(vendor_code="V0001", name="Steel Supplies").save()
+    item = InventoryItemDoc(code="RM0001", name="Steel rod", quantity=10).save()
+
+    response = client.post("/grn_new", data={
+        "grn_number": "GRN0001",
+        "vendor_id": str(vendor.id),
+        "item_id": str(item.id),
+        "quantity": "25",
+        "received_date": "2025-01-15",
+        "invoice_number": "INV-1",
+        "total_amount": "1000",
+        "status": "Approved",
+    })
+
+    assert response.status_code == 302
+    grn = GRNDoc.objects.get(grn_number="GRN0001")
+    assert grn.item.id == item.id and grn.quantity == 25
+    movement = StockMovementDoc.objects.get(item=item.id)
+    assert (movement.movement_type, movement.quantity, movement.reference) == ("Receipt", 25, "GRN0001")
+    item.reload()
+    assert item.quantity == 35
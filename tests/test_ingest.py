@@ -0,0 +1,59 @@
+"""Validation of posted production entries before the id checks.
+
+No database; skipped when mongoengine (needed to import the ingest module)
+is not installed.
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("mongoengine")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+
+from ingest import _parse_entry  # noqa: E402
+
+MACHINE, OPERATOR, WORK_ORDER = ObjectId(), ObjectId(), ObjectId()
+
+
+def row(**changes):
+    posted = {"machine": str(MACHINE), "operator": str(OPERATOR), "quantity_produced": 40, "shift": "A",
+              "date": "2025-02-03T06:15:00"}
+    posted.update(changes)
+    return {key: value for key, value in posted.items() if value is not None}
+
+
+def test_valid_entry():
+    entry, error = _parse_entry(row(work_order=str(WORK_ORDER), remarks=123))
+    assert error is None
+    assert entry == {"machine": MACHINE, "operator": OPERATOR, "work_order": WORK_ORDER,
+                     "quantity_produced": 40.0, "shift": "A", "date": datetime(2025, 2, 3, 6, 15),
+                     "remarks": "123"}
+
+
+def test_date_defaults_to_now():
+    before = datetime.utcnow()
+    entry, _ = _parse_entry(row(date=None))
+    assert before <= entry["date"] <= datetime.utcnow()
+    assert "work_order" not in entry and "remarks" not in entry
+
+
+@pytest.mark.parametrize("posted, error", [
+    ([1, 2], "Expected an object"),
+    (row(machine="M-01"), "machine and operator must be ids"),
+    (row(operator=None), "machine and operator must be ids"),
+    (row(work_order="WO-1"), "work_order must be an id"),
+    (row(quantity_produced="40"), "quantity_produced must be a non-negative number"),
+    (row(quantity_produced=True), "quantity_produced must be a non-negative number"),
+    (row(quantity_produced=-1), "quantity_produced must be a non-negative number"),
+    (row(shift=""), "shift is required (at most 20 characters)"),
+    (row(shift="x" * 21), "shift is required (at most 20 characters)"),
+    (row(date="03/02/2025"), "date must be an ISO timestamp"),
+    (row(date=20250203), "date must be an ISO timestamp"),
+])
+def test_rejected_entries(posted, error):
+    assert _parse_entry(posted) == (None, error)
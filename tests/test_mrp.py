@@ -0,0 +1,49 @@
+"""Low-level codes and level-by-level BOM explosion.
+
+Pure planning, no database; skipped when mongoengine (needed to import the
+mrp module) is not installed.
+"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("mongoengine")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mrp import BOMCycleError, explode, low_level_codes  # noqa: E402
+
+# A uses C directly and through B, and D sits at the bottom of three paths
+BOMS = {
+    "A": [("B", 2), ("C", 1)],
+    "B": [("C", 3), ("D", 1)],
+    "C": [("D", 2)],
+}
+
+
+def test_low_level_code_is_the_deepest_level():
+    assert low_level_codes(BOMS) == {"A": 0, "B": 1, "C": 2, "D": 3}
+
+
+def test_cycle_is_reported():
+    with pytest.raises(BOMCycleError) as error:
+        low_level_codes({"X": [("Y", 1)], "Y": [("X", 1)], "Z": [("X", 1)]})
+    assert sorted(error.value.items) == ["X", "Y"]
+
+
+def test_explode_nets_each_level_once():
+    result = explode({"A": 10}, BOMS, {"B": 5, "C": 0, "D": 100})
+    assert result == {
+        "A": (0, 0.0, 0.0, 10.0),
+        "B": (1, 20.0, 15.0, 15.0),    # 2 per A, less 5 on hand
+        "C": (2, 55.0, 55.0, 55.0),    # 10 for A plus 3 per B still to make
+        "D": (3, 125.0, 25.0, 0.0),    # 15 for B plus 2 per C; bought, never made
+    }
+
+
+def test_stock_covering_a_make_item_stops_the_explosion():
+    result = explode({"A": 1}, BOMS, {"B": 2, "C": 1})
+    assert result["B"] == (1, 2.0, 0.0, 0.0)
+    assert result["C"] == (2, 1.0, 0.0, 0.0)
+    assert "D" not in result
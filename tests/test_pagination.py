@@ -0,0 +1,93 @@
+"""Keyset cursors and the count strategies of QuerySetPagination.
+
+No database; skipped when Flask-Login or mongoengine (needed to import the
+utils module) is not installed.
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("flask_login")
+pytest.importorskip("mongoengine")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+
+from utils import QuerySetPagination, decode_cursor, encode_cursor  # noqa: E402
+
+
+class Doc:
+    def __init__(self, created_at, doc_id):
+        self.created_at = created_at
+        self.id = doc_id
+
+
+class FakeCollection:
+    full_name = "mes_test.things"
+
+    def __init__(self, matches, estimate):
+        self.matches = matches
+        self.estimate = estimate
+        self.count_limits = []
+
+    def estimated_document_count(self):
+        return self.estimate
+
+    def count_documents(self, query, limit=0):
+        self.count_limits.append(limit)
+        return min(self.matches, limit) if limit else self.matches
+
+
+class FakeQuerySet:
+    """Just enough of a QuerySet for QuerySetPagination"""
+
+    def __init__(self, query, collection):
+        self._query = query
+        self._collection = collection
+        self._skip = self._limit = 0
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def __iter__(self):
+        return iter(range(self._skip, min(self._skip + self._limit, self._collection.matches)))
+
+
+def test_cursor_round_trip():
+    doc_id = ObjectId()
+    created_at = datetime(2025, 3, 1, 9, 30, 15, 250000)
+    cursor = encode_cursor(Doc(created_at, doc_id))
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, doc_id)
+    assert encode_cursor({"created_at": created_at, "_id": doc_id}) == cursor
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "bm90fGFuIGlk", "MjAyNS0wMS0wMXxub3QtYW4taWQ"])
+def test_malformed_cursor_is_ignored(cursor):
+    assert decode_cursor(cursor) is None
+
+
+def test_unfiltered_total_is_the_estimate():
+    collection = FakeCollection(matches=25, estimate=25)
+    pager = QuerySetPagination(FakeQuerySet({}, collection), 1, 10, count_cap=20)
+    assert (pager.total, pager.total_capped, pager.pages) == (25, False, 3)
+    assert collection.count_limits == []
+
+
+def test_filtered_total_stops_at_the_cap():
+    collection = FakeCollection(matches=95, estimate=500)
+    pager = QuerySetPagination(FakeQuerySet({"status": "Open"}, collection), 5, 10, count_cap=50)
+    assert (pager.total, pager.total_capped, pager.pages) == (50, True, 5)
+    assert collection.count_limits == [51]
+    assert pager.has_next and pager.items == list(range(40, 50))
+
+    pager = QuerySetPagination(FakeQuerySet({"status": "Open"}, collection), 10, 10, count_cap=50)
+    assert pager.items == list(range(90, 95)) and not pager.has_next
@@ -0,0 +1,68 @@
+"""schedule() places job cards by priority on machines of the right type.
+
+Pure planning, no database; skipped when mongoengine or pymongo (needed to
+import the scheduler module) is not installed.
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mongoengine")
+pytest.importorskip("pymongo")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import schedule  # noqa: E402
+
+START = datetime(2025, 1, 6, 8, 0)
+MACHINES = {"L1": "Lathe", "L2": "Lathe", "C1": "CNC"}
+
+
+def job(job_id, machine_type="Lathe", machine=None, started=False, work_order=None, hours=1.0,
+        priority="Normal", due_date=None, created_at=None):
+    return {"id": job_id, "machine": machine, "machine_type": machine_type, "started": started,
+            "work_order": work_order, "hours": hours, "priority": priority, "due_date": due_date,
+            "created_at": created_at}
+
+
+def test_priority_then_due_date_then_creation():
+    jobs = [
+        job("low", machine_type="CNC", priority="Low"),
+        job("late", machine_type="CNC", due_date=START + timedelta(days=5)),
+        job("soon", machine_type="CNC", due_date=START + timedelta(days=1)),
+        job("urgent", machine_type="CNC", priority="Urgent"),
+    ]
+    plan = schedule(jobs, MACHINES, START)
+    assert [job_id for job_id, _ in sorted(plan.items(), key=lambda item: item[1][3])] == \
+        ["urgent", "soon", "late", "low"]
+    assert plan["urgent"][1:3] == (START, START + timedelta(hours=1))
+    assert plan["soon"][1] == START + timedelta(hours=1)
+
+
+def test_only_machines_of_the_needed_type():
+    plan = schedule([job("a"), job("b"), job("c"), job("mill", machine_type="Mill"), job("none", machine_type=None)],
+                    MACHINES, START)
+    assert {plan[job_id][0] for job_id in "abc"} <= {"L1", "L2"}
+    assert sorted(plan[job_id][1] for job_id in "abc") == [START, START, START + timedelta(hours=1)]
+    assert "mill" not in plan and "none" not in plan
+
+
+def test_started_cards_hold_their_machine_from_start():
+    jobs = [
+        job("urgent", machine="L1", priority="Urgent", hours=2),
+        job("running", machine="L1", started=True, priority="Low", hours=0.5),
+        job("orphan", machine="L9", started=True),
+    ]
+    plan = schedule(jobs, MACHINES, START)
+    assert plan["running"] == ("L1", START, START + timedelta(minutes=30), 0)
+    assert plan["urgent"] == ("L1", START + timedelta(minutes=30), START + timedelta(hours=2, minutes=30), 1)
+    assert "orphan" not in plan
+
+
+def test_work_order_cards_run_in_turn():
+    jobs = [job("first", machine_type="CNC", work_order="WO1", created_at=START),
+            job("second", work_order="WO1", created_at=START + timedelta(minutes=1))]
+    plan = schedule(jobs, MACHINES, START)
+    assert plan["second"][1] == plan["first"][2]
@@ -1,11 +1,23 @@
 from flask_login import current_user
-from datetime import datetime
+from datetime import date, datetime
+from itertools import islice
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+import binascii
+import json
 import string
 import random
+import threading
+import time
 
 from math import ceil
+from bson import DBRef, ObjectId
+from bson.errors import InvalidId
+from mongoengine import Q, ValidationError
+from pymongo.errors import BulkWriteError
 
 class SimplePagination:
+    keyset = False
+
     def __init__(self, items, page, per_page):
         self.page = page
         self.per_page = per_page
@@ -31,6 +43,225 @@ class SimplePagination:
                 last = num
 
 
+COUNT_CACHE_TTL = 30  # seconds a filtered count is reused for
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+def count_queryset(queryset, ttl=COUNT_CACHE_TTL, cap=None):
+    """Count a QuerySet for a pager as cheaply as the caller allows.
+
+    - unfiltered: use the collection metadata estimate
+    - filtered with cap: count at most cap + 1 documents ("more than N" mode)
+    - filtered: exact count_documents, cached per query for ttl seconds
+    """
+    collection = queryset._collection
+    query = queryset._query
+    if not query:
+        return collection.estimated_document_count()
+    if cap is not None:
+        return collection.count_documents(query, limit=cap + 1)
+
+    key = (collection.full_name, repr(query))
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    total = collection.count_documents(query)
+    with _count_cache_lock:
+        if len(_count_cache) > 1000:
+            for stale in [k for k, (expires, _) in _count_cache.items() if expires <= now]:
+                del _count_cache[stale]
+        _count_cache[key] = (now + ttl, total)
+    return total
+
+
+class QuerySetPagination(SimplePagination):
+    """Paginate a MongoEngine QuerySet with skip/limit so only one page is loaded.
+
+    Pass count_cap to stop counting a filtered query after that many
+    documents; total_capped then tells the template the real total is larger.
+    """
+    def __init__(self, queryset, page, per_page, count_cap=None, count_ttl=COUNT_CACHE_TTL):
+        self.page = max(page, 1)
+        self.per_page = per_page
+        if not queryset._query:
+            count_cap = None  # the collection estimate is already cheap, keep it whole
+        total = count_queryset(queryset, ttl=count_ttl, cap=count_cap)
+        self.total_capped = count_cap is not None and total > count_cap
+        self.total = min(total, count_cap) if self.total_capped else total
+        self.pages = ceil(self.total / per_page)
+        self.items = list(queryset.skip((self.page-1)*per_page).limit(per_page))
+        self.has_prev = self.page > 1
+        self.has_next = self.page < self.pages or (self.total_capped and len(self.items) == per_page)
+        self.prev_num = self.page - 1
+        self.next_num = self.page + 1
+
+
+def prefetch_references(documents, *field_names, **projections):
+    """Resolve ReferenceFields for a page of documents in one batch.
+
+    Referenced ids are collected across all rows and fields and fetched with
+    one $in query per referenced document class, so a page costs a fixed
+    number of queries instead of one lazy dereference per row and field.
+    Fields passed as keywords are resolved too, loading only the listed
+    fields of the referenced documents, e.g. product=("name",).
+    References to documents that no longer exist resolve to None.
+    """
+    field_names = field_names + tuple(projections)
+    wanted = {}
+    only = {}
+    for doc in documents:
+        for name in field_names:
+            value = doc._data.get(name)
+            if isinstance(value, (DBRef, ObjectId)):
+                doc_type = doc._fields[name].document_type
+                wanted.setdefault(doc_type, set()).add(getattr(value, "id", value))
+                if name in projections and only.get(doc_type, ()) is not None:
+                    only[doc_type] = set(only.get(doc_type, ())) | set(projections[name])
+                else:
+                    only[doc_type] = None
+
+    resolved = {}
+    for doc_type, ids in wanted.items():
+        queryset = doc_type.objects(id__in=list(ids))
+        if only.get(doc_type):
+            queryset = queryset.only(*only[doc_type])
+        for ref in queryset:
+            resolved[(doc_type, ref.id)] = ref
+
+    for doc in documents:
+        for name in field_names:
+            value = doc._data.get(name)
+            if isinstance(value, (DBRef, ObjectId)):
+                doc_type = doc._fields[name].document_type
+                doc._data[name] = resolved.get((doc_type, getattr(value, "id", value)))
+    return documents
+
+
+def encode_cursor(doc):
+    """Encode a document's (created_at, id) position as an opaque URL-safe cursor.
+
+    doc may also be a raw dict from as_pymongo()."""
+    if isinstance(doc, dict):
+        raw = f"{doc['created_at'].isoformat()}|{doc['_id']}"
+    else:
+        raw = f"{doc.created_at.isoformat()}|{doc.id}"
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, returning None if it is malformed"""
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, doc_id = raw.split("|")
+        return datetime.fromisoformat(created_at), ObjectId(doc_id)
+    except (ValueError, binascii.Error, InvalidId):
+        return None
+
+
+class KeysetPagination:
+    """Cursor pagination on (created_at, _id), newest first.
+
+    Each page is a bounded range scan on the (-created_at, -_id) index, so
+    deep pages cost the same as the first one and no total count is needed.
+    """
+    keyset = True
+
+    def __init__(self, queryset, per_page, after=None, before=None):
+        self.per_page = per_page
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+
+        if before:
+            created_at, doc_id = before
+            queryset = queryset.filter(created_at__gte=created_at).filter(
+                Q(created_at__gt=created_at) | Q(id__gt=doc_id))
+            rows = list(queryset.order_by('created_at', 'id').limit(per_page + 1))
+            self.has_prev = len(rows) > per_page
+            self.has_next = True
+            self.items = rows[:per_page][::-1]
+        else:
+            if after:
+                created_at, doc_id = after
+                queryset = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=doc_id))
+            rows = list(queryset.order_by('-created_at', '-id').limit(per_page + 1))
+            self.has_next = len(rows) > per_page
+            self.has_prev = after is not None
+            self.items = rows[:per_page]
+
+        self.next_cursor = encode_cursor(self.items[-1]) if self.has_next and self.items else None
+        self.prev_cursor = encode_cursor(self.items[0]) if self.has_prev and self.items else None
+
+
+NDJSON_BATCH_SIZE = 500  # documents per cursor round trip when streaming a list API
+
+
+def json_value(value):
+    """JSON-safe form of a raw field value: references as their id, dates as ISO strings"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, DBRef):
+        return str(value.id)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if hasattr(value, "pk"):  # already dereferenced document
+        return str(value.pk)
+    return value
+
+
+def ndjson_lines(queryset, serialize, batch_size=NDJSON_BATCH_SIZE):
+    """Yield a queryset as newline-delimited JSON, one chunk per cursor batch.
+
+    serialize turns a list of documents into a list of records; only one
+    batch is held at a time."""
+    cursor = iter(queryset.batch_size(batch_size))
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            return
+        yield "".join(json.dumps(record) + "\n" for record in serialize(batch))
+
+
+def bulk_insert(documents):
+    """Validate documents and insert the valid ones with one unordered insert_many.
+
+    Returns one entry per document: None when it was inserted (its id is
+    set), otherwise an error message. Documents failing validation are not
+    sent, and a duplicate key or other write error only fails its own row.
+    """
+    errors = [None] * len(documents)
+    pending = []  # (position in documents, raw document)
+    for i, doc in enumerate(documents):
+        try:
+            doc.validate()
+        except ValidationError as e:
+            errors[i] = "; ".join(f"{field}: {message}" for field, message in e.to_dict().items()) or str(e)
+            continue
+        pending.append((i, doc.to_mongo()))
+    if not pending:
+        return errors
+
+    try:
+        type(documents[0])._get_collection().insert_many([raw for _, raw in pending], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details["writeErrors"]:
+            i = pending[error["index"]][0]
+            if error["code"] == 11000:
+                duplicate = ", ".join(f"{key} {value}" for key, value in error.get("keyValue", {}).items())
+                errors[i] = f"Duplicate {duplicate}".strip()
+            else:
+                errors[i] = error["errmsg"]
+    for i, raw in pending:
+        if errors[i] is None:
+            documents[i].id = raw["_id"]
+    return errors
+
+
 def generate_code(prefix, length=8):
     """Generate a unique code with given prefix"""
     timestamp = datetime.now().strftime('%y%m%d')